@@ -0,0 +1,144 @@
+"""
+End-to-end benchmark of the question loop against the local fake chat page.
+
+Starts fake_chat_server.py in-process, points run_automation() at it in
+headless Chrome with a throwaway profile, and reports questions/hour,
+detection lag after each answer truly finished, and WebDriver commands
+per question (from the run's trace.jsonl).
+
+    python benchmark.py --questions 20 --detection observer
+"""
+import argparse
+import json
+import os
+import statistics
+import tempfile
+import time
+
+import chat_automation
+from fake_chat_server import FakeChatServer
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def run_benchmark(args):
+    server = FakeChatServer(token_rate=args.token_rate, tokens=args.tokens,
+                            first_token_delay=args.first_token_delay, jitter=args.jitter).start()
+    workdir = tempfile.mkdtemp(prefix="june-bench-")
+    previous_dir = os.getcwd()
+    os.chdir(workdir)
+
+    with open(chat_automation.QUESTIONS_FILE, "w", encoding="utf-8") as f:
+        for n in range(args.questions):
+            f.write(f"Benchmark question {n + 1}: " + "x" * max(0, args.question_chars - 25) + "\n")
+
+    chat_automation.AI_WEBSITE_URL = server.url
+    chat_automation.PERSISTENT_PROFILE_DIR = os.path.join(workdir, "chrome_profile")
+    chat_automation.HEADLESS = not args.headed
+    chat_automation.LOGIN_CHECK = False
+    chat_automation.HUMAN_PAUSES = args.human_pauses
+    chat_automation.DETECTION_MODE = args.detection
+    chat_automation.INPUT_STRATEGY = args.input_strategy
+    if args.record:
+        chat_automation.TRACE_RECORD_DIR = os.path.abspath(os.path.join(previous_dir, args.record))
+
+    detections = []
+    wait_for_response = chat_automation.wait_for_response
+
+    def timed_wait_for_response(driver, *a, **kw):
+        result = wait_for_response(driver, *a, **kw)
+        detections.append({"at": time.time(), "completed": result})
+        return result
+
+    chat_automation.wait_for_response = timed_wait_for_response
+
+    started = time.time()
+    try:
+        chat_automation.run_automation()
+    finally:
+        chat_automation.wait_for_response = wait_for_response
+        os.chdir(previous_dir)
+        server.stop()
+    elapsed = time.time() - started
+
+    stage_commands = {}
+    question_commands = []
+    with open(os.path.join(workdir, chat_automation.TRACE_FILE), "r", encoding="utf-8") as f:
+        for line in f:
+            record = json.loads(line)
+            question_commands.append(sum(record["commands"].values()))
+            for stage, count in record["commands"].items():
+                stage_commands[stage] = stage_commands.get(stage, 0) + count
+
+    sent = server.events_of("sent")
+    completions = {e["index"]: e["at"] / 1000 for e in server.events_of("complete")}
+    lags = []
+    early = 0
+    for n, detection in enumerate(detections, start=1):
+        truth = completions.get(n)
+        if truth is None or detection["at"] < truth:
+            early += 1
+        else:
+            lags.append(detection["at"] - truth)
+
+    answered = len(detections)
+    report = {
+        "questions": answered,
+        "detection": args.detection,
+        "input_strategy": args.input_strategy,
+        "wall_seconds": round(elapsed, 1),
+        "questions_per_hour": None,
+        "lag_mean": None,
+        "lag_p50": None,
+        "lag_p95": None,
+        "early_or_missed": early,
+        "commands_per_question": None,
+        "commands_by_stage": {k: round(v / max(1, len(question_commands)), 1)
+                              for k, v in sorted(stage_commands.items())},
+        "workdir": workdir
+    }
+    if answered and sent:
+        loop_seconds = detections[-1]["at"] - sent[0]["at"] / 1000
+        if loop_seconds > 0:
+            report["questions_per_hour"] = round(answered / loop_seconds * 3600, 1)
+    if lags:
+        report["lag_mean"] = round(statistics.mean(lags), 3)
+        report["lag_p50"] = round(percentile(lags, 0.5), 3)
+        report["lag_p95"] = round(percentile(lags, 0.95), 3)
+    if question_commands:
+        report["commands_per_question"] = round(statistics.mean(question_commands), 1)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark run_automation() against the fake chat page.")
+    parser.add_argument("--questions", type=int, default=10)
+    parser.add_argument("--question-chars", type=int, default=60, help="length of each question")
+    parser.add_argument("--token-rate", type=float, default=30)
+    parser.add_argument("--tokens", type=int, default=150)
+    parser.add_argument("--first-token-delay", type=float, default=0.8)
+    parser.add_argument("--jitter", type=float, default=0.3)
+    parser.add_argument("--detection", choices=["observer", "polling", "network"], default=chat_automation.DETECTION_MODE)
+    parser.add_argument("--input-strategy", choices=sorted(chat_automation.INPUT_STRATEGIES),
+                        default=chat_automation.INPUT_STRATEGY)
+    parser.add_argument("--human-pauses", action="store_true", help="keep the human-like pauses")
+    parser.add_argument("--headed", action="store_true", help="show the browser window")
+    parser.add_argument("--record", help="save polled snapshots here for replay_traces.py (polling detection)")
+    parser.add_argument("--json", help="also write the report to this file")
+    args = parser.parse_args()
+
+    report = run_benchmark(args)
+
+    print("\n📊 Benchmark results")
+    for key, value in report.items():
+        print(f"   {key}: {value}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,7 +2,24 @@ import time
 import os
 import random
 import json
+import copy
+import heapq
+import hashlib
+import base64
 import shutil
+import tarfile
+import tempfile
+import sqlite3
+import threading
+import queue
+from concurrent.futures import ProcessPoolExecutor
+from html.parser import HTMLParser
+import re
+import subprocess
+import sys
+import urllib.request
+from collections import Counter, OrderedDict, defaultdict, deque
+from contextlib import contextmanager
 from datetime import datetime, timedelta
 from selenium import webdriver
 from selenium.webdriver.chrome.service import Service
@@ -10,7 +27,7 @@ from selenium.webdriver.common.by import By
 from selenium.webdriver.common.keys import Keys
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
-from selenium.common.exceptions import TimeoutException, NoSuchElementException, ElementClickInterceptedException
+from selenium.common.exceptions import TimeoutException, NoSuchElementException, ElementClickInterceptedException, WebDriverException
 from selenium.webdriver.common.action_chains import ActionChains
 from webdriver_manager.chrome import ChromeDriverManager
 
@@ -20,9 +37,53 @@ INPUT_BOX_XPATH = "//textarea[@placeholder='Type your question here...']"
 SEND_BUTTON_XPATH = "//button[@aria-label='submit']"
 MODEL_SELECTOR_XPATH = "//button[@data-tour='model-selector']"
 HEADLESS = False
-PROGRESS_FILE = "progress.json"
-MODEL_TRACKING_FILE = "model_tracking.json"
+LOGIN_CHECK = True  # ask for login confirmation before starting
+HUMAN_PAUSES = True  # random pauses, breaks and mouse moves between questions
+INPUT_STRATEGY = "human"  # "human", "bulk", "chunked" or "paste" (see INPUT_STRATEGIES)
+INPUT_CHUNK_SIZE = 200  # characters per send_keys call in "chunked" mode
+PROGRESS_FILE = "progress.json"  # only read to migrate older runs
+MODEL_TRACKING_FILE = "model_tracking.json"  # only read to migrate older runs
+STATE_FILE = "state.json"
+STATE_WAL_FILE = "state.wal"
+STATE_COMPACT_EVERY = 200  # logged changes before the snapshot is rewritten
 PERSISTENT_PROFILE_DIR = os.path.join(os.getcwd(), "chrome_profile")
+PROFILE_PRUNE_OVER_MB = 300  # clear the profile's caches on start once it is bigger (None = never)
+PROFILE_SNAPSHOT_FILE = "chrome_profile.tar.gz"  # known-good logged-in profile (see "profile snapshot")
+PROFILE_RUNTIME_DIR = None  # e.g. "/dev/shm/june_profile": run Chrome from a copy restored here
+PROFILE_RESTORE_IF_BROKEN = True  # restore the snapshot if Chrome won't start with the profile
+DRIVER_CACHE_FILE = "driver_cache.json"  # resolved chromedriver path, reused offline
+ATTACH_TO_RUNNING_BROWSER = False  # reuse a Chrome already listening on DEBUGGER_ADDRESS
+DEBUGGER_ADDRESS = "127.0.0.1:9222"
+LEAN_PROFILE = False  # skip images, fonts, media and third-party hosts the chat doesn't need
+LEAN_BLOCKED_URLS = ["*.png", "*.jpg", "*.jpeg", "*.gif", "*.webp", "*.ico",
+                     "*.woff", "*.woff2", "*.ttf", "*.otf", "*.mp4", "*.webm", "*.mp3"]
+LEAN_ALLOWED_HOSTS = []  # third-party hosts to keep loading in lean mode (e.g. a login provider)
+HEALTH_CHECK_TIMEOUT = 15  # seconds before an unanswered probe means the browser is hung
+MAX_BROWSER_RESTARTS = 10  # per run
+MAX_QUESTION_ATTEMPTS = 3  # before a question goes to the dead-letter file
+RETRY_QUEUE_LIMIT = 50
+DEAD_LETTER_FILE = "dead_letter.jsonl"
+QUESTIONS_FILE = "questions.txt"  # or a .jsonl file with {"id": ..., "question": ...} per line
+QUESTION_INDEX_STRIDE = 1000  # questions between offsets saved in the .idx sidecar
+SAMPLE_QUESTIONS = ["What is artificial intelligence?", "How does machine learning work?"]
+RESULTS_FILE = "results.jsonl"
+RESULTS_DB_FILE = None  # e.g. "results.db" to also keep a queryable SQLite copy
+RESULTS_FSYNC_EVERY = 10  # answers written between fsyncs
+RESULTS_FSYNC_INTERVAL = 30  # max seconds between fsyncs
+ANSWER_CACHE_FILE = "answer_cache.jsonl"  # answers by question hash + model
+ANSWER_CACHE_POLICY = "reuse"  # repeated questions: "reuse" (save cached answer), "skip" or "off" (ask again)
+ANSWER_CACHE_MEMORY = 1000  # cached answers kept in memory
+POSTPROCESS_WORKERS = 2  # background threads parsing and saving answers
+POSTPROCESS_QUEUE_SIZE = 100  # answers waiting for a worker before the browser loop blocks
+POSTPROCESS_USE_PROCESSES = False  # parse HTML in worker processes instead of threads
+BATCH_SIZE = 1  # short questions packed into one prompt (1 = one question per prompt)
+BATCH_CHAR_BUDGET = 2000  # longest packed prompt, in characters
+BATCH_MODEL_CHAR_BUDGETS = {}  # per-model overrides, e.g. {"DeepSeek R1": 1000}
+BATCH_MAX_QUESTION_CHARS = 300  # longer (or multi-line) questions are always sent alone
+BATCH_PROMPT_HEADER = ("Answer each of the following questions separately. Start each answer "
+                       "on a new line with \"Answer <number>:\" using the question's number.")
+TRACE_FILE = "trace.jsonl"  # one line of stage timings per question
+METRICS_FILE = "metrics.prom"  # running totals in Prometheus text format
 
 
 MODELS = [
@@ -36,8 +97,12 @@ MODELS = [
     "Gemini 2.5 Flash"
 ]
 
+# Called with each new driver, e.g. to instrument it (see benchmark.py)
+DRIVER_HOOKS = []
+
 MODEL_USAGE_LIMIT_HOURS = 5
 MODEL_COOLDOWN_HOURS = 4
+MODEL_SWITCH_MARGIN = 600  # seconds before the usage limit to switch away
 
 # Response detection selectors - try multiple approaches
 RESPONSE_SELECTORS = [
@@ -54,106 +119,1127 @@ RESPONSE_SELECTORS = [
     "div[class*='markdown']"
 ]
 
+# Elements that mean the AI is still generating
+TYPING_INDICATOR_SELECTORS = [
+    "[class*='typing']",
+    "[class*='loading']",
+    "[class*='pending']",
+    "[class*='generating']",
+    ".dots",
+    ".spinner"
+]
 
-try:
-    with open("questions.txt", "r", encoding="utf-8") as f:
-        QUESTIONS = [line.strip() for line in f if line.strip()]
-except FileNotFoundError:
-    print("❌ questions.txt file not found. Creating a sample file...")
-    QUESTIONS = ["What is artificial intelligence?", "How does machine learning work?"]
-    with open("questions.txt", "w", encoding="utf-8") as f:
-        for q in QUESTIONS:
-            f.write(q + "\n")
-    print("✅ Created questions.txt with sample questions")
+# Response detection mode: "observer" (in-page MutationObserver), "polling",
+# or "network" (the chat API request finishing, from Chrome's performance log)
+DETECTION_MODE = "observer"
+OBSERVER_QUIET_PERIOD = 1.5  # seconds the last message must stay unchanged
+OBSERVER_MAX_WAIT = 50  # longest single in-page wait; longer timeouts are split up
+CHAT_API_URL_PATTERN = r"/api/.*(chat|completion|message|conversation)"  # regex for the answer request
+NETWORK_REQUEST_WAIT = 10  # seconds to wait for that request before watching the page instead
+NETWORK_POLL_INTERVAL = 0.25  # seconds between reads of the performance log
+NETWORK_RENDER_DELAY = 0.3  # let the page draw the last tokens after the stream ends
+NETWORK_CAPTURE_BODY = False  # also rebuild the answer from the streamed response body
+REQUIRED_STABLE_CHECKS = 3  # polling: unchanged probes before an answer counts as finished
+TRACE_RECORD_DIR = None  # folder to save polled snapshot timelines in, for replay_traces.py
+TRACE_RECORD_TAIL = 5  # seconds to keep recording after the decision (shows early finishes)
 
+# Long chats slow the page down, so optionally start a new conversation when one gets big
+ROTATE_CONVERSATION_EVERY = 0  # questions per conversation (0 = never)
+ROTATE_MAX_DOM_NODES = 0  # page elements added since the conversation began (0 = no limit)
+ROTATE_MAX_HEAP_MB = 0  # page JS heap growth (MB) since the conversation began (0 = no limit)
+ROTATE_MIN_QUESTIONS = 10  # questions before the page size limits apply
+NEW_CHAT_URL = None  # page that opens an empty conversation (None = AI_WEBSITE_URL)
 
-def load_progress():
-    """Load saved progress and model tracking."""
-    start_index = 0
-    model_data = {}
+# Timeouts and polling adapt to how long each model usually takes
+RESPONSE_TIMEOUT = 60  # seconds to wait on a model with no timings yet
+RESPONSE_TIMEOUT_MIN = 10
+RESPONSE_TIMEOUT_MAX = 600
+LATENCY_MIN_SAMPLES = 5  # answers timed before a model's own statistics are trusted
+LATENCY_TIMEOUT_SIGMAS = 4  # timeout = mean answer time + this many standard deviations
+LATENCY_PEAK_DECAY = 0.9  # how much of the slowest recent answer time is kept after each new answer
+POLL_INTERVAL_MIN = 0.2  # polling is tightest around the expected finish...
+POLL_INTERVAL_MAX = 2.0  # ...and backs off to this far from it
+
+
+# --- Question Source ---
+class QuestionSource:
+    """
+    Streams questions from a .txt file (one per line) or a .jsonl file
+    ({"id": ..., "question": ...} per line) without loading it into memory.
+    A sidecar .idx file keeps the byte offset of every `stride`-th question
+    so resuming seeks close to the right line instead of re-reading the file.
+    """
+    def __init__(self, path=QUESTIONS_FILE, stride=QUESTION_INDEX_STRIDE):
+        self.path = path
+        self.stride = stride
+        self.is_jsonl = path.endswith(".jsonl")
+        self.index_path = path + ".idx"
+        self.offsets = None
     
-    if os.path.exists(PROGRESS_FILE):
+    def _file_signature(self):
+        stat = os.stat(self.path)
+        # "format" changes whenever the counting rules do, so older indexes are rebuilt
+        return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "stride": self.stride, "format": 2}
+    
+    def _load_index(self):
+        """Use the sidecar index if it matches the file, otherwise rebuild it."""
+        signature = self._file_signature()
+        if os.path.exists(self.index_path):
+            try:
+                with open(self.index_path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+                if all(data.get(k) == v for k, v in signature.items()):
+                    return data["offsets"]
+            except Exception:
+                pass
+        return self._build_index(signature)
+    
+    def _build_index(self, signature):
+        print(f"ℹ️ Indexing {self.path}...")
+        offsets = []
+        count = 0
+        position = 0
+        with open(self.path, "rb") as f:
+            for line in f:
+                if self._line_text(line):
+                    if count % self.stride == 0:
+                        offsets.append(position)
+                    count += 1
+                position += len(line)
+        data = dict(signature, offsets=offsets, count=count)
         try:
-            with open(PROGRESS_FILE, "r", encoding="utf-8") as f:
-                data = json.load(f)
-                start_index = data.get("last_index", 0)
-        except Exception:
-            start_index = 0
+            tmp_path = self.index_path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self.index_path)
+        except OSError as ex:
+            print(f"⚠️ Could not save question index: {ex}")
+        return offsets
+    
+    @staticmethod
+    def _line_text(raw):
+        """Text of a raw line, "" if blank. Indexing and reading must skip the same lines."""
+        return raw.decode("utf-8", "replace").strip()
     
-    if os.path.exists(MODEL_TRACKING_FILE):
+    def _parse(self, line, index):
+        """Return (question_id, text) for a non-empty line."""
+        if not self.is_jsonl:
+            return str(index + 1), line
         try:
-            with open(MODEL_TRACKING_FILE, "r", encoding="utf-8") as f:
-                model_data = json.load(f)
-        except Exception:
-            model_data = {}
+            obj = json.loads(line)
+        except ValueError:
+            obj = None
+        text = (obj.get("question") or obj.get("text") or "") if isinstance(obj, dict) else None
+        if not isinstance(text, str):
+            print(f"⚠️ Skipping malformed line for question {index + 1}")
+            return None
+        text = text.strip()
+        if not text:
+            return None
+        return str(obj.get("id", index + 1)), text
+    
+    def iter_from(self, start_index=0):
+        """Yield (index, question_id, text) from `start_index` (0-based) on."""
+        if self.offsets is None:
+            self.offsets = self._load_index()
+        if not self.offsets:
+            return
+        checkpoint = min(start_index // self.stride, len(self.offsets) - 1)
+        index = checkpoint * self.stride
+        with open(self.path, "rb") as f:
+            f.seek(self.offsets[checkpoint])
+            for raw in f:
+                line = self._line_text(raw)
+                if not line:
+                    continue
+                if index >= start_index:
+                    parsed = self._parse(line, index)
+                    if parsed:
+                        yield (index,) + parsed
+                index += 1
     
-    return start_index, model_data
+    def __iter__(self):
+        return self.iter_from(0)
+
+def ensure_questions_file(path=QUESTIONS_FILE):
+    """Create a sample questions file if none exists."""
+    if os.path.exists(path):
+        return
+    print(f"❌ {path} file not found. Creating a sample file...")
+    with open(path, "w", encoding="utf-8") as f:
+        for q in SAMPLE_QUESTIONS:
+            if path.endswith(".jsonl"):
+                f.write(json.dumps({"question": q}) + "\n")
+            else:
+                f.write(q + "\n")
+    print(f"✅ Created {path} with sample questions")
 
-def save_progress(index):
-    """Save current progress to file."""
-    try:
-        with open(PROGRESS_FILE, "w", encoding="utf-8") as f:
-            json.dump({"last_index": index}, f)
-    except Exception as ex:
-        print(f"⚠️ Could not save progress: {ex}")
 
-def save_model_tracking(model_data):
-    """Save model usage tracking."""
+# --- State Store ---
+class StateStore:
+    """
+    Crash-safe run state: a JSON snapshot plus an append-only log of changes.
+    The snapshot is only ever replaced by atomic rename, and a torn last
+    log line (Ctrl+C, power loss) is ignored on the next load.
+    """
+    def __init__(self, path=STATE_FILE, wal_path=STATE_WAL_FILE):
+        self.path = path
+        self.wal_path = wal_path
+        self.state = {}
+        self.entries = 0
+        self.lock = threading.RLock()  # updated from the loop and the post-processing workers
+        
+        if os.path.exists(path):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    self.state = json.load(f)
+            except Exception as ex:
+                print(f"⚠️ Could not read state snapshot: {ex}")
+        elif not os.path.exists(wal_path):
+            self.state = self._migrate_legacy_files()
+        
+        replayed, torn = self._replay_wal()
+        self.wal = open(wal_path, "a", encoding="utf-8")
+        # A torn entry must not stay in the log, or the next one is appended to it
+        if replayed or torn or not os.path.exists(path):
+            self.compact()
+    
+    def _migrate_legacy_files(self):
+        """Import progress.json and model_tracking.json from older runs."""
+        state = {}
+        for key, file_path in (("last_index", PROGRESS_FILE), ("models", MODEL_TRACKING_FILE)):
+            if os.path.exists(file_path):
+                try:
+                    with open(file_path, "r", encoding="utf-8") as f:
+                        data = json.load(f)
+                    state[key] = data.get("last_index", 0) if key == "last_index" else data
+                except Exception:
+                    pass
+        return state
+    
+    def _replay_wal(self):
+        """Apply logged changes on top of the snapshot; returns (entries applied, torn entry seen)."""
+        if not os.path.exists(self.wal_path):
+            return 0, False
+        count = 0
+        with open(self.wal_path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    delta = json.loads(line)
+                except ValueError:
+                    print("⚠️ Ignoring incomplete state log entry.")
+                    return count, True
+                self._apply(delta)
+                count += 1
+        return count, False
+    
+    def _apply(self, delta):
+        # One level of merge: {"models": {name: info}} replaces just that model
+        for key, value in delta.items():
+            if isinstance(value, dict) and isinstance(self.state.get(key), dict):
+                self.state[key].update(value)
+            else:
+                self.state[key] = value
+    
+    def get(self, key, default=None):
+        return self.state.get(key, default)
+    
+    def update(self, delta):
+        """Apply a change and append it durably to the log."""
+        with self.lock:
+            self._apply(delta)
+            self.wal.write(json.dumps(delta) + "\n")
+            self.wal.flush()
+            os.fsync(self.wal.fileno())
+            self.entries += 1
+            if self.entries >= STATE_COMPACT_EVERY:
+                self.compact()
+    
+    def compact(self):
+        """Write a fresh snapshot atomically and truncate the log."""
+        with self.lock:
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self.state, f, indent=2)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+            if hasattr(os, "O_DIRECTORY"):
+                dir_fd = os.open(os.path.dirname(os.path.abspath(self.path)), os.O_DIRECTORY)
+                try:
+                    os.fsync(dir_fd)
+                finally:
+                    os.close(dir_fd)
+            # Replaying old entries over the new snapshot is harmless, so a crash
+            # between the rename and the truncate loses nothing
+            self.wal.close()
+            self.wal = open(self.wal_path, "w", encoding="utf-8")
+            self.entries = 0
+    
+    def close(self):
+        try:
+            self.compact()
+        finally:
+            self.wal.close()
+
+_state_store = None
+
+def get_state_store():
+    """Open the state store on first use."""
+    global _state_store
+    if _state_store is None:
+        _state_store = StateStore()
+    return _state_store
+
+def close_state_store():
+    global _state_store
+    if _state_store is not None:
+        _state_store.close()
+        _state_store = None
+
+def load_progress():
+    """Load saved progress and model tracking."""
+    store = get_state_store()
+    return store.get("last_index", 0), copy.deepcopy(store.get("models", {}))
+
+def save_model_tracking(model_data, model=None):
+    """Save model usage tracking (only `model` if given)."""
     try:
-        with open(MODEL_TRACKING_FILE, "w", encoding="utf-8") as f:
-            json.dump(model_data, f, indent=2)
+        if model is not None:
+            model_data = {model: model_data[model]}
+        get_state_store().update({"models": copy.deepcopy(model_data)})
     except Exception as ex:
         print(f"⚠️ Could not save model tracking: {ex}")
 
+# --- Answer Store ---
+class AnswerStore:
+    """Append-only JSONL journal of answers, optionally mirrored to SQLite."""
+    def __init__(self, path=RESULTS_FILE, db_path=RESULTS_DB_FILE):
+        self.file = open(path, "a", encoding="utf-8")
+        self.db = None
+        self.unsynced = 0
+        self.last_sync = time.time()
+        if db_path:
+            # Written from the post-processing workers, one at a time
+            self.db = sqlite3.connect(db_path, check_same_thread=False)
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.execute("PRAGMA synchronous=NORMAL")
+            self.db.execute("""
+                CREATE TABLE IF NOT EXISTS answers (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    question_index INTEGER,
+                    question_id TEXT,
+                    question TEXT,
+                    model TEXT,
+                    response_text TEXT,
+                    response_html TEXT,
+                    response_markdown TEXT,
+                    code_blocks TEXT,
+                    tables TEXT,
+                    citations TEXT,
+                    response_sha256 TEXT,
+                    sent_at TEXT,
+                    finished_at TEXT,
+                    latency REAL,
+                    completed INTEGER,
+                    cached INTEGER
+                )
+            """)
+            self.db.execute("CREATE INDEX IF NOT EXISTS answers_question ON answers (question_index)")
+    
+    def record(self, index, question_id, question, model, response, sent_at, finished_at, completed=True,
+               cached=False):
+        """Append one answer; fsync happens in batches."""
+        entry = {
+            "index": index,
+            "question_id": question_id,
+            "question": question,
+            "model": model,
+            "response_text": response.get("text", ""),
+            "response_html": response.get("html", ""),
+            "response_markdown": response.get("markdown", ""),
+            "code_blocks": response.get("code_blocks", []),
+            "tables": response.get("tables", []),
+            "citations": response.get("citations", []),
+            "response_sha256": response.get("sha256"),
+            "sent_at": sent_at.isoformat(),
+            "finished_at": finished_at.isoformat(),
+            "latency": round((finished_at - sent_at).total_seconds(), 3),
+            "completed": completed,
+            "cached": cached
+        }
+        self.file.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        if self.db:
+            self.db.execute(
+                "INSERT INTO answers (question_index, question_id, question, model, response_text,"
+                " response_html, response_markdown, code_blocks, tables, citations, response_sha256,"
+                " sent_at, finished_at, latency, completed, cached)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (index, question_id, question, model, entry["response_text"], entry["response_html"],
+                 entry["response_markdown"], json.dumps(entry["code_blocks"]),
+                 json.dumps(entry["tables"]), json.dumps(entry["citations"]), entry["response_sha256"],
+                 entry["sent_at"], entry["finished_at"], entry["latency"], int(completed), int(cached))
+            )
+        self.unsynced += 1
+        if self.unsynced >= RESULTS_FSYNC_EVERY or time.time() - self.last_sync >= RESULTS_FSYNC_INTERVAL:
+            self.sync()
+    
+    def sync(self):
+        """Flush buffered answers to disk."""
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        if self.db:
+            self.db.commit()
+        self.unsynced = 0
+        self.last_sync = time.time()
+    
+    def close(self):
+        try:
+            self.sync()
+        finally:
+            self.file.close()
+            if self.db:
+                self.db.close()
+
+# --- Answer Cache ---
+def question_key(question, model):
+    """Hash of the normalized question text and the model name."""
+    normalized = " ".join(question.lower().split()).rstrip("?.! ")
+    return hashlib.sha256(f"{model}\0{normalized}".encode("utf-8")).hexdigest()
+
+class AnswerCache:
+    """
+    Content-addressed answers, keyed by question_key(). The file holds one
+    "<key>\t<json>" line per answer; only key -> byte offset is indexed in
+    memory, with the most recently used answers kept in a bounded LRU. The
+    offsets are saved to a sidecar .idx file on close, so startup only reads
+    the entries added after it was written.
+    """
+    def __init__(self, path=ANSWER_CACHE_FILE, memory=ANSWER_CACHE_MEMORY):
+        self.path = path
+        self.index_path = path + ".idx"
+        self.memory = memory
+        self.offsets = {}
+        self.recent = OrderedDict()
+        self.lock = threading.Lock()
+        
+        position = self._load_index()
+        needs_newline = False
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                f.seek(position)
+                for line in f:
+                    key, sep, _ = line.partition(b"\t")
+                    if sep and len(key) == 64 and line.endswith(b"\n"):
+                        self.offsets[key.decode("ascii")] = position
+                    needs_newline = not line.endswith(b"\n")
+                    position += len(line)
+        self.reader = None
+        self.file = open(path, "ab")
+        if needs_newline:
+            # Don't glue the next entry onto a torn last line
+            self.file.write(b"\n")
+    
+    def _load_index(self):
+        """Offsets from the sidecar index; returns the file position it covers (0 if unusable)."""
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data["size"] <= os.path.getsize(self.path):
+                self.offsets = data["offsets"]
+                return data["size"]
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+        return 0
+    
+    def _save_index(self):
+        try:
+            tmp_path = self.index_path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"size": self.file.tell(), "offsets": self.offsets}, f)
+            os.replace(tmp_path, self.index_path)
+        except OSError as ex:
+            print(f"⚠️ Could not save answer cache index: {ex}")
+    
+    def __len__(self):
+        return len(self.offsets)
+    
+    def _remember(self, key, response):
+        self.recent[key] = response
+        self.recent.move_to_end(key)
+        while len(self.recent) > self.memory:
+            self.recent.popitem(last=False)
+    
+    def get(self, question, model):
+        """Cached response for this question and model, or None."""
+        key = question_key(question, model)
+        with self.lock:
+            if key in self.recent:
+                self.recent.move_to_end(key)
+                return self.recent[key]
+            offset = self.offsets.get(key)
+            if offset is None:
+                return None
+            self.file.flush()
+            if self.reader is None:
+                self.reader = open(self.path, "rb")
+            self.reader.seek(offset)
+            stored_key, _, data = self.reader.readline().partition(b"\t")
+            if stored_key != key.encode("ascii"):
+                return None  # stale index (the cache file was replaced)
+            try:
+                response = json.loads(data)
+            except ValueError:
+                return None
+            self._remember(key, response)
+            return response
+    
+    def put(self, question, model, response):
+        """Cache a finished answer."""
+        key = question_key(question, model)
+        line = key.encode("ascii") + b"\t" + json.dumps(response, ensure_ascii=False).encode("utf-8") + b"\n"
+        with self.lock:
+            self.offsets[key] = self.file.tell()
+            self.file.write(line)
+            self._remember(key, response)
+    
+    def close(self):
+        self.file.flush()
+        self._save_index()
+        self.file.close()
+        if self.reader:
+            self.reader.close()
+
+# --- Post-processing ---
+class ResponseExtractor(HTMLParser):
+    """
+    Turns an answer's HTML into markdown, collecting its code blocks,
+    tables and cited links along the way.
+    """
+    BLOCK_TAGS = {"p", "div", "section", "article", "blockquote", "ul", "ol", "table"}
+    SKIP_TAGS = {"script", "style", "button", "svg", "noscript"}
+    
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts = []
+        self.code_blocks = []
+        self.tables = []
+        self.citations = []
+        self.cited = {}  # url -> citation
+        self.lists = []
+        self.links = []
+        self.skip_depth = 0
+        self.code = None  # collected text while inside <pre>
+        self.table = None  # rows collected while inside <table>
+        self.saved_parts = []  # outer output while a table cell is collected
+    
+    def _trailing_newlines(self):
+        count = 0
+        for part in reversed(self.parts):
+            stripped = part.rstrip("\n")
+            count += len(part) - len(stripped)
+            if stripped:
+                return count
+        return count if self.parts else -1
+    
+    def _newline(self, count=1):
+        if self.table is not None and self.saved_parts:
+            self.parts.append(" ")  # no line breaks inside a table cell
+            return
+        trailing = self._trailing_newlines()
+        if 0 <= trailing < count:
+            self.parts.append("\n" * (count - trailing))
+    
+    def _cite(self, href, label, marker):
+        citation = self.cited.get(href)
+        if citation is None:
+            citation = self.cited[href] = {"n": len(self.citations) + 1, "url": href, "title": None}
+            self.citations.append(citation)
+        if marker:
+            citation["n"] = int(marker)
+        elif label and not citation["title"]:
+            citation["title"] = label
+    
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        if tag in self.SKIP_TAGS:
+            self.skip_depth += 1
+        elif self.skip_depth:
+            return
+        elif self.code is not None:
+            if tag == "code" and not self.code["language"]:
+                self.code["language"] = _code_language(attrs)
+        elif tag == "pre":
+            self.code = {"language": _code_language(attrs), "text": []}
+        elif tag == "table":
+            self._newline(2)
+            self.table = []
+        elif tag == "tr" and self.table is not None:
+            self.table.append({"cells": [], "header": False})
+        elif tag in ("td", "th") and self.table is not None:
+            if not self.table:
+                self.table.append({"cells": [], "header": False})
+            if tag == "th":
+                self.table[-1]["header"] = True
+            self.saved_parts.append(self.parts)
+            self.parts = []
+        elif tag in ("h1", "h2", "h3", "h4", "h5", "h6"):
+            self._newline(2)
+            self.parts.append("#" * int(tag[1]) + " ")
+        elif tag in ("ul", "ol"):
+            self._newline(1 if self.lists else 2)
+            self.lists.append([tag, 0])
+        elif tag == "li":
+            self._newline()
+            indent = "  " * (len(self.lists) - 1)
+            if self.lists and self.lists[-1][0] == "ol":
+                self.lists[-1][1] += 1
+                self.parts.append(f"{indent}{self.lists[-1][1]}. ")
+            else:
+                self.parts.append(f"{indent}- ")
+        elif tag in self.BLOCK_TAGS:
+            self._newline(2)
+        elif tag == "hr":
+            self._newline(2)
+            self.parts.append("---")
+            self._newline(2)
+        elif tag == "br":
+            self._newline()
+        elif tag == "img" and attrs.get("src"):
+            self.parts.append(f"![{attrs.get('alt') or ''}]({attrs['src']})")
+        elif tag in ("strong", "b"):
+            self.parts.append("**")
+        elif tag in ("em", "i"):
+            self.parts.append("*")
+        elif tag == "code":
+            self.parts.append("`")
+        elif tag == "a":
+            self.links.append((attrs.get("href"), len(self.parts)))
+            self.parts.append("[")
+    
+    def handle_endtag(self, tag):
+        if tag in self.SKIP_TAGS:
+            self.skip_depth = max(0, self.skip_depth - 1)
+        elif self.skip_depth:
+            return
+        elif tag == "pre" and self.code is not None:
+            code = "".join(self.code["text"]).strip("\n")
+            self.code_blocks.append({"language": self.code["language"], "code": code})
+            self._newline(2)
+            self.parts.append(f"```{self.code['language'] or ''}\n{code}\n```")
+            self._newline(2)
+            self.code = None
+        elif self.code is not None:
+            return
+        elif tag in ("td", "th") and self.saved_parts:
+            cell = re.sub(r"\s+", " ", "".join(self.parts)).strip()
+            self.parts = self.saved_parts.pop()
+            self.table[-1]["cells"].append(cell)
+        elif tag == "table" and self.table is not None:
+            self._end_table()
+        elif tag in ("h1", "h2", "h3", "h4", "h5", "h6"):
+            self._newline(2)
+        elif tag in ("ul", "ol"):
+            if self.lists:
+                self.lists.pop()
+            self._newline(1 if self.lists else 2)
+        elif tag in self.BLOCK_TAGS:
+            self._newline(2)
+        elif tag in ("strong", "b"):
+            self.parts.append("**")
+        elif tag in ("em", "i"):
+            self.parts.append("*")
+        elif tag == "code":
+            self.parts.append("`")
+        elif tag == "a" and self.links:
+            href, start = self.links.pop()
+            if not href or href.startswith(("#", "javascript:")):
+                self.parts[start] = ""  # in-page link: keep just its text
+                return
+            label = re.sub(r"\s+", " ", "".join(self.parts[start + 1:])).strip()
+            if href.startswith(("http://", "https://")):
+                # Footnote-style markers like "1" or "[1]" keep the page's number
+                marker = re.fullmatch(r"\[?(\d+)\]?", label)
+                self._cite(href, label, marker and marker.group(1))
+                if marker:
+                    del self.parts[start:]
+                    self.parts.append(f"[{marker.group(1)}]({href})")
+                    return
+            self.parts.append(f"]({href})")
+    
+    def _end_table(self):
+        rows = [row for row in self.table if row["cells"]]
+        self.table = None
+        if not rows:
+            return
+        header = rows.pop(0)["cells"] if rows[0]["header"] else []
+        body = [row["cells"] for row in rows]
+        self.tables.append({"header": header, "rows": body})
+        
+        width = max(len(cells) for cells in [header] + body)
+        def line(cells):
+            cells = [c.replace("|", "\\|") for c in cells] + [""] * (width - len(cells))
+            return "| " + " | ".join(cells) + " |"
+        lines = [line(header or [""] * width), "|" + " --- |" * width]
+        lines.extend(line(cells) for cells in body)
+        self._newline(2)
+        self.parts.append("\n".join(lines))
+        self._newline(2)
+    
+    def handle_data(self, data):
+        if self.skip_depth:
+            return
+        if self.code is not None:
+            self.code["text"].append(data)
+        else:
+            self.parts.append(re.sub(r"\s+", " ", data))
+    
+    def markdown(self):
+        text = "".join(self.parts)
+        text = re.sub(r"[ \t]+\n", "\n", text)
+        return re.sub(r"\n{3,}", "\n\n", text).strip()
+
+def _code_language(attrs):
+    """Language from a class like "language-python" or "lang-js"."""
+    match = re.search(r"\b(?:language|lang)-([\w+#.-]+)", attrs.get("class") or "")
+    return match.group(1) if match else None
+
+def extract_response(html):
+    """Parse an answer's outerHTML into markdown, code blocks, tables and citations."""
+    extractor = ResponseExtractor()
+    extractor.feed(html)
+    extractor.close()
+    return {
+        "markdown": extractor.markdown(),
+        "code_blocks": extractor.code_blocks,
+        "tables": extractor.tables,
+        "citations": extractor.citations
+    }
+
+def process_response(raw):
+    """Derive the structured answer and a content hash from a captured answer."""
+    text = raw.get("text", "")
+    if raw.get("html"):
+        structured = extract_response(raw["html"])
+    else:
+        structured = {"markdown": text, "code_blocks": [], "tables": [], "citations": []}
+    return dict(raw, sha256=hashlib.sha256(text.encode("utf-8")).hexdigest(), **structured)
+
+class PostProcessor:
+    """
+    Parses and saves captured answers on background workers, so the browser
+    loop only hands them over. The queue is bounded: if the workers fall
+    behind, the loop waits rather than piling answers up in memory. Progress
+    goes through checkpoint(), so it is only saved once the answers before it
+    are on disk (or dead-lettered, if saving them failed).
+    """
+    def __init__(self, answer_store, answer_cache, workers=POSTPROCESS_WORKERS,
+                 queue_size=POSTPROCESS_QUEUE_SIZE, use_processes=POSTPROCESS_USE_PROCESSES):
+        self.answer_store = answer_store
+        self.answer_cache = answer_cache
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.write_lock = threading.Lock()
+        self.next_job = 0
+        self.unsaved = set()  # jobs submitted but not yet on disk
+        self.unsynced = set()  # jobs written but waiting for the answer store's next fsync
+        self.checkpoints = deque()  # (jobs submitted before it, state delta)
+        self.parse_pool = ProcessPoolExecutor(workers) if use_processes else None
+        self.threads = [threading.Thread(target=self._work, daemon=True) for _ in range(workers)]
+        for thread in self.threads:
+            thread.start()
+    
+    def submit(self, index, question_id, question, model, response, sent_at, finished_at,
+               completed=True, cached=False):
+        """Queue one captured answer for parsing and saving."""
+        with self.write_lock:
+            job_id = self.next_job
+            self.next_job += 1
+            self.unsaved.add(job_id)
+        self.queue.put({
+            "id": job_id,
+            "index": index,
+            "question_id": question_id,
+            "question": question,
+            "model": model,
+            "response": response,
+            "sent_at": sent_at,
+            "finished_at": finished_at,
+            "completed": completed,
+            "cached": cached
+        })
+    
+    def _work(self):
+        while True:
+            job = self.queue.get()
+            try:
+                if job is None:
+                    return
+                self._handle(job)
+            except Exception as ex:
+                print(f"⚠️ Could not save answer for Q{job['index']}, see {DEAD_LETTER_FILE}: {ex}")
+                write_dead_letter(job["index"], job["question_id"], job["question"], 1, f"saving failed: {ex}")
+                with self.write_lock:
+                    self.unsaved.discard(job["id"])
+                    self.unsynced.discard(job["id"])
+                    self._save_checkpoints()
+            finally:
+                self.queue.task_done()
+    
+    def _handle(self, job):
+        raw = job["response"]
+        if self.parse_pool:
+            response = self.parse_pool.submit(process_response, raw).result()
+        else:
+            response = process_response(raw)
+        with self.write_lock:
+            self.answer_store.record(
+                job["index"], job["question_id"], job["question"], job["model"], response,
+                job["sent_at"], job["finished_at"], completed=job["completed"], cached=job["cached"]
+            )
+            self.unsynced.add(job["id"])
+            if not self.answer_store.unsynced:  # record() just fsynced
+                self._synced()
+        if job["completed"] and not job["cached"] and raw.get("text"):
+            self.answer_cache.put(job["question"], job["model"], {"text": raw["text"], "html": raw.get("html", "")})
+    
+    def checkpoint(self, delta):
+        """Save `delta` to the state store once every answer submitted so far is on disk."""
+        with self.write_lock:
+            self.checkpoints.append((self.next_job, delta))
+            self._save_checkpoints()
+    
+    def _synced(self):
+        self.unsaved -= self.unsynced
+        self.unsynced.clear()
+        self._save_checkpoints()
+    
+    def _save_checkpoints(self):
+        # In order, so a later retry queue or progress is never overwritten by an earlier one
+        oldest = min(self.unsaved, default=self.next_job)
+        while self.checkpoints and self.checkpoints[0][0] <= oldest:
+            delta = self.checkpoints.popleft()[1]
+            try:
+                get_state_store().update(delta)
+            except Exception as ex:
+                print(f"⚠️ Could not save progress: {ex}")
+    
+    def close(self):
+        """Finish everything still queued, save it to disk, then stop the workers."""
+        for _ in self.threads:
+            self.queue.put(None)
+        for thread in self.threads:
+            thread.join()
+        with self.write_lock:
+            try:
+                self.answer_store.sync()
+                self._synced()
+            except OSError as ex:
+                print(f"⚠️ Could not save answers: {ex}")
+        if self.parse_pool:
+            self.parse_pool.shutdown()
+
+# --- Instrumentation ---
+class Instrumentation:
+    """
+    Per-question timing spans and chromedriver command counts by stage.
+    Each question becomes one line in TRACE_FILE, and running totals are
+    rewritten to METRICS_FILE so they can be scraped locally.
+    """
+    def __init__(self, trace_path=TRACE_FILE, metrics_path=METRICS_FILE):
+        self.trace = open(trace_path, "a", encoding="utf-8")
+        self.metrics_path = metrics_path
+        self.stage = "startup"
+        self.question = None
+        self.spans = defaultdict(float)
+        self.commands = defaultdict(int)
+        self.events = []
+        self.total_questions = 0
+        self.total_seconds = defaultdict(float)
+        self.total_commands = defaultdict(int)
+    
+    def attach(self, driver):
+        """Count every command the driver sends to chromedriver."""
+        execute = driver.command_executor.execute
+        
+        def counting_execute(command, params):
+            self.commands[self.stage] += 1
+            return execute(command, params)
+        
+        driver.command_executor.execute = counting_execute
+    
+    @contextmanager
+    def span(self, stage):
+        """Time a block and attribute its driver commands to `stage`."""
+        previous = self.stage
+        self.stage = stage
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.spans[stage] += time.perf_counter() - start
+            self.stage = previous
+    
+    def split_span(self, stage, new_stage, seconds):
+        """Move the first `seconds` of a recorded span into another stage."""
+        seconds = min(seconds, self.spans[stage])
+        self.spans[stage] -= seconds
+        self.spans[new_stage] += seconds
+    
+    def event(self, name, message=None, **fields):
+        """Print a diagnostic and keep it in the current question's trace."""
+        if message:
+            print(message)
+        self.events.append(dict(fields, name=name, at=round(time.time(), 3)))
+    
+    def begin_question(self, index, question_id):
+        # Commands outside a question (startup, recovery) still count in totals
+        for stage, count in self.commands.items():
+            self.total_commands[stage] += count
+        self.question = {"index": index, "question_id": question_id, "started_at": round(time.time(), 3)}
+        self.stage = "other"
+        self.spans.clear()
+        self.commands.clear()
+        self.events = []
+    
+    def end_question(self, **fields):
+        """Write the question's trace line and refresh the metrics file."""
+        if self.question is None:
+            return
+        record = dict(self.question, **fields)
+        record["spans"] = {k: round(v, 4) for k, v in self.spans.items()}
+        record["commands"] = dict(self.commands)
+        record["events"] = self.events
+        self.trace.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self.trace.flush()
+        
+        self.total_questions += 1
+        for stage, seconds in self.spans.items():
+            self.total_seconds[stage] += seconds
+        for stage, count in self.commands.items():
+            self.total_commands[stage] += count
+        self.question = None
+        self.stage = "other"
+        self.write_metrics()
+    
+    def write_metrics(self):
+        lines = [
+            "# HELP june_questions_total Questions processed.",
+            "# TYPE june_questions_total counter",
+            f"june_questions_total {self.total_questions}",
+            "# HELP june_stage_seconds_total Time spent per stage.",
+            "# TYPE june_stage_seconds_total counter"
+        ]
+        for stage, seconds in sorted(self.total_seconds.items()):
+            lines.append(f'june_stage_seconds_total{{stage="{stage}"}} {seconds:.4f}')
+        lines += [
+            "# HELP june_webdriver_commands_total Chromedriver commands per stage.",
+            "# TYPE june_webdriver_commands_total counter"
+        ]
+        for stage, count in sorted(self.total_commands.items()):
+            lines.append(f'june_webdriver_commands_total{{stage="{stage}"}} {count}')
+        try:
+            tmp_path = self.metrics_path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write("\n".join(lines) + "\n")
+            os.replace(tmp_path, self.metrics_path)
+        except OSError as ex:
+            print(f"⚠️ Could not write metrics: {ex}")
+    
+    def close(self):
+        self.trace.close()
+
 # --- Model Management ---
+class LatencyProfiles:
+    """
+    Time to first token and total answer time per model, kept as running
+    mean/variance (Welford) in the state file next to the model tracking.
+    "peak" is the slowest recent answer: it fades by LATENCY_PEAK_DECAY with
+    every answer, so one slow answer or timeout doesn't stretch timeouts forever.
+    """
+    def __init__(self, data=None):
+        if data is None:
+            data = copy.deepcopy(get_state_store().get("latency", {}))
+        self.data = data
+    
+    def _stats(self, model, metric):
+        stats = self.data.setdefault(model, {}).setdefault(
+            metric, {"count": 0, "mean": 0.0, "m2": 0.0, "max": 0.0})
+        stats.setdefault("peak", 0.0)  # state saved before peaks were kept
+        return stats
+    
+    def _add(self, model, metric, value):
+        stats = self._stats(model, metric)
+        stats["count"] += 1
+        delta = value - stats["mean"]
+        stats["mean"] += delta / stats["count"]
+        stats["m2"] += delta * (value - stats["mean"])
+        stats["max"] = max(stats["max"], value)
+        stats["peak"] = max(value, stats["peak"] * LATENCY_PEAK_DECAY)
+    
+    def record(self, model, total, first_token=None, completed=True):
+        """Add one answer's timings (seconds since it was sent)."""
+        if not model:
+            return
+        if first_token is not None:
+            self._add(model, "ttft", first_token)
+        if completed:
+            self._add(model, "total", total)
+        else:
+            # It took at least as long as we waited: give the next answer more room
+            stats = self._stats(model, "total")
+            stats["peak"] = max(stats["peak"], total)
+        try:
+            get_state_store().update({"latency": copy.deepcopy(self.data)})
+        except Exception as ex:
+            print(f"⚠️ Could not save latency profile: {ex}")
+    
+    def expected(self, model, metric="total"):
+        """(mean, standard deviation, samples) for a model, or None if never timed."""
+        stats = self.data.get(model, {}).get(metric)
+        if not stats or not stats["count"]:
+            return None
+        std = (stats["m2"] / (stats["count"] - 1)) ** 0.5 if stats["count"] > 1 else 0.0
+        return stats["mean"], std, stats["count"]
+    
+    def timeout_for(self, model):
+        """Seconds to wait for an answer from this model before giving up."""
+        stats = self.data.get(model, {}).get("total")
+        if not stats:
+            return RESPONSE_TIMEOUT
+        mean, std, count = self.expected(model) or (0.0, 0.0, 0)
+        peak = stats.get("peak", 0.0)
+        if count < LATENCY_MIN_SAMPLES:
+            timeout = max(RESPONSE_TIMEOUT, peak * 1.5)
+        else:
+            timeout = max(mean + LATENCY_TIMEOUT_SIGMAS * std, peak * 1.2)
+        return min(RESPONSE_TIMEOUT_MAX, max(RESPONSE_TIMEOUT_MIN, timeout))
+    
+    def poll_interval(self, model, elapsed):
+        """
+        Seconds until the next check, `elapsed` seconds into the wait: short
+        near the model's usual finish time, longer well before or after it.
+        """
+        expected = self.expected(model)
+        if expected is None:
+            return 1.0
+        distance = abs(expected[0] - elapsed)
+        return min(POLL_INTERVAL_MAX, max(POLL_INTERVAL_MIN, distance / 4))
+
 class ModelManager:
-    def __init__(self, driver, wait):
+    """
+    Tracks per-model usage and picks the next model to use. Models that are
+    ready wait in a heap ordered by their position in MODELS; models in
+    cooldown wait in a heap ordered by when they become available again.
+    """
+    def __init__(self, driver, wait, model_data=None, latency=None):
         self.driver = driver
         self.wait = wait
+        self.latency = latency if latency is not None else LatencyProfiles()
         self.model_data = {}
         self.current_model = None
-        self.load_model_data()
+        self.usage_started = None
+        self.ready = []  # (priority, model)
+        self.cooling = []  # (available_at on the monotonic clock, priority, model)
+        if model_data is not None:
+            self.model_data = model_data
+        else:
+            self.load_model_data()
+        self._schedule_models()
     
     def load_model_data(self):
         """Load model tracking data."""
-        if os.path.exists(MODEL_TRACKING_FILE):
-            try:
-                with open(MODEL_TRACKING_FILE, "r", encoding="utf-8") as f:
-                    self.model_data = json.load(f)
-            except Exception:
-                self.model_data = {}
+        self.model_data = load_progress()[1]
+    
+    def _schedule_models(self):
+        """Build the ready/cooling heaps from the saved tracking data."""
+        now = datetime.now()
+        self.ready = []
+        self.cooling = []
+        for priority, model in enumerate(MODELS):
+            cooldown_until = self._cooldown_until(model)
+            if cooldown_until and cooldown_until > now:
+                available_at = time.monotonic() + (cooldown_until - now).total_seconds()
+                heapq.heappush(self.cooling, (available_at, priority, model))
+                continue
+            if cooldown_until:
+                # Cooled down while the script was stopped: start its usage afresh
+                self.model_data[model] = {"usage_time": 0}
+                save_model_tracking(self.model_data, model)
+            heapq.heappush(self.ready, (priority, model))
+    
+    def _cooldown_until(self, model):
+        """Wall-clock end of the model's cooldown, or None if it isn't exhausted."""
+        model_info = self.model_data.get(model)
+        if not model_info:
+            return None
+        if model_info.get("cooldown_until"):
+            return datetime.fromisoformat(model_info["cooldown_until"])
+        if model_info.get("usage_time", 0) >= MODEL_USAGE_LIMIT_HOURS * 3600 - MODEL_SWITCH_MARGIN:
+            # Older tracking data only has the start of the usage window
+            last_start = datetime.fromisoformat(model_info.get("last_start", "2020-01-01T00:00:00"))
+            return last_start + timedelta(hours=MODEL_USAGE_LIMIT_HOURS + MODEL_COOLDOWN_HOURS)
+        return None
+    
+    def _release_cooled_down(self):
+        """Move models whose cooldown has ended back to the ready heap."""
+        now = time.monotonic()
+        while self.cooling and self.cooling[0][0] <= now:
+            _, priority, model = heapq.heappop(self.cooling)
+            # Reset model after cooldown
+            self.model_data[model] = {"usage_time": 0}
+            save_model_tracking(self.model_data, model)
+            heapq.heappush(self.ready, (priority, model))
+    
+    def _take(self, model):
+        """Remove a model from both heaps (it is about to be used)."""
+        self.ready = [entry for entry in self.ready if entry[1] != model]
+        self.cooling = [entry for entry in self.cooling if entry[2] != model]
+        heapq.heapify(self.ready)
+        heapq.heapify(self.cooling)
+    
+    def _retire(self, model):
+        """Put an exhausted model into cooldown."""
+        cooldown_until = datetime.now() + timedelta(hours=MODEL_COOLDOWN_HOURS)
+        self.model_data[model]["cooldown_until"] = cooldown_until.isoformat()
+        save_model_tracking(self.model_data, model)
+        self._take(model)
+        available_at = time.monotonic() + MODEL_COOLDOWN_HOURS * 3600
+        heapq.heappush(self.cooling, (available_at, MODELS.index(model) if model in MODELS else len(MODELS), model))
+        print(f"🧊 {model} is cooling down until {cooldown_until:%H:%M}")
     
     def get_available_model(self):
         """Get next available model based on usage and cooldown."""
-        current_time = datetime.now()
-        
-        for model in MODELS:
-            if model not in self.model_data:
+        self._release_cooled_down()
+        for priority, model in sorted(self.ready):
+            if model != self.current_model:
                 return model
-            
-            model_info = self.model_data[model]
-            last_start = datetime.fromisoformat(model_info.get("last_start", "2020-01-01T00:00:00"))
-            usage_time = model_info.get("usage_time", 0)
-            
-            # Check if model is in cooldown
-            if usage_time >= MODEL_USAGE_LIMIT_HOURS * 3600:
-                cooldown_end = last_start + timedelta(hours=MODEL_USAGE_LIMIT_HOURS + MODEL_COOLDOWN_HOURS)
-                if current_time < cooldown_end:
-                    continue
-                else:
-                    # Reset model after cooldown
-                    self.model_data[model] = {"usage_time": 0}
-                    return model
-            else:
-                return model
-        
         return None
     
+    def seconds_until_available(self):
+        """Seconds until the next model in cooldown frees up (None if none are)."""
+        if not self.cooling:
+            return None
+        return max(0.0, self.cooling[0][0] - time.monotonic())
+    
+    def wait_for_available_model(self):
+        """Sleep exactly until the next model leaves its cooldown."""
+        delay = self.seconds_until_available()
+        if delay is None:
+            return
+        print(f"😴 All models are cooling down, sleeping {delay / 60:.1f} minutes until one is free...")
+        time.sleep(delay)
+    
     def switch_model(self, target_model=None):
         """Switch to a different model."""
         try:
             print(f"🔄 Attempting to switch model...")
             
+            if not target_model:
+                target_model = self.get_available_model()
+            
+            if not target_model:
+                print("⚠️ No available models at this time")
+                return False
             
             time.sleep(random.uniform(1, 3))
             
@@ -174,14 +1260,6 @@ class ModelManager:
             
             time.sleep(random.uniform(1, 2))
             
-         
-            if not target_model:
-                target_model = self.get_available_model()
-            
-            if not target_model:
-                print("⚠️ No available models at this time")
-                return False
-            
             # Try to find and click the model option
             model_xpath = f"//span[text()='{target_model}']"
             try:
@@ -197,13 +1275,14 @@ class ModelManager:
                 
                 # Update tracking
                 self.current_model = target_model
+                self._take(target_model)
                 if target_model not in self.model_data:
                     self.model_data[target_model] = {}
                 self.model_data[target_model]["last_start"] = datetime.now().isoformat()
                 if "usage_time" not in self.model_data[target_model]:
                     self.model_data[target_model]["usage_time"] = 0
                 
-                save_model_tracking(self.model_data)
+                save_model_tracking(self.model_data, target_model)
                 return True
                 
             except TimeoutException:
@@ -219,11 +1298,32 @@ class ModelManager:
             print(f"⚠️ Error switching model: {e}")
             return False
     
+    def use_driver(self, driver, wait):
+        """Point the manager at a new browser after a restart."""
+        self.driver = driver
+        self.wait = wait
+    
+    def begin_usage(self):
+        """Start timing model use (typing until the answer is done)."""
+        self.usage_started = time.monotonic()
+    
+    def end_usage(self):
+        """Stop timing and add the elapsed time to the current model."""
+        if self.usage_started is None:
+            return
+        elapsed = time.monotonic() - self.usage_started
+        self.usage_started = None
+        self.update_usage_time(elapsed)
+    
     def update_usage_time(self, elapsed_seconds):
         """Update usage time for current model."""
         if self.current_model and self.current_model in self.model_data:
             self.model_data[self.current_model]["usage_time"] += elapsed_seconds
-            save_model_tracking(self.model_data)
+            save_model_tracking(self.model_data, self.current_model)
+            model_info = self.model_data[self.current_model]
+            if ("cooldown_until" not in model_info and
+                    model_info["usage_time"] >= MODEL_USAGE_LIMIT_HOURS * 3600 - MODEL_SWITCH_MARGIN):
+                self._retire(self.current_model)
     
     def should_switch_model(self):
         """Check if we should switch to a different model."""
@@ -233,103 +1333,592 @@ class ModelManager:
         if self.current_model not in self.model_data:
             return False
         
-        usage_time = self.model_data[self.current_model].get("usage_time", 0)
-        return usage_time >= (MODEL_USAGE_LIMIT_HOURS * 3600 - 600)  # Switch 10 min before limit
+        # Switch MODEL_SWITCH_MARGIN before the limit
+        return "cooldown_until" in self.model_data[self.current_model]
 
 # --- Response Detection --- (stiil needs a bit more work)
-def wait_for_response_improved(driver, timeout=10, check_interval=1):
+
+# Shared page helpers, prepended to the scripts below. Once the list holding
+# the messages is known, the newest message is looked for in its last few
+# children only, instead of matching every message on the page. Pass
+# `pageWide` to match the whole page anyway and re-check that list.
+_DOM_HELPERS_JS = """
+function commonAncestor(a, b) {
+    for (let node = a.parentElement; node; node = node.parentElement) {
+        if (node.contains(b)) return node;
+    }
+    return null;
+}
+function messageList(a, b, selectors, matched) {
+    // The common ancestor of two matches of `matched`, if they sit in different
+    // children of it and it isn't inside another kind of match (then they are
+    // likely two blocks of one answer)
+    const list = commonAncestor(a, b);
+    if (!list || a.contains(b) || b.contains(a)) return null;
+    for (const sel of selectors) {
+        if (sel === matched) continue;
+        try { if (list.closest(sel)) return null; } catch (e) { continue; }
+    }
+    return list;
+}
+function matchAfter(list, sel) {
+    // Whether anything after the list in the page matches (a newer message elsewhere)
+    for (let node = list; node && node !== document.body; node = node.parentElement) {
+        for (let el = node.nextElementSibling; el; el = el.nextElementSibling) {
+            if (el.matches(sel) || el.querySelector(sel)) return true;
+        }
+    }
+    return false;
+}
+function lastMessage(selectors, pageWide) {
+    const list = window.__juneMessageList;
+    if (list && list.isConnected && !pageWide) {
+        for (const sel of selectors) {
+            try {
+                if (matchAfter(list, sel)) break;
+            } catch (e) { continue; }
+            let el = list.lastElementChild;
+            for (let n = 0; el && n < 4; n++, el = el.previousElementSibling) {
+                let found = null;
+                try {
+                    const inner = el.querySelectorAll(sel);
+                    found = inner.length ? inner[inner.length - 1] : (el.matches(sel) ? el : null);
+                } catch (e) { break; }
+                if (found) {
+                    window.__juneLastSelector = sel;
+                    return found;
+                }
+            }
+        }
+    }
+    for (const sel of selectors) {
+        let nodes;
+        try { nodes = document.querySelectorAll(sel); } catch (e) { continue; }
+        if (nodes.length) {
+            const last = nodes[nodes.length - 1];
+            window.__juneLastSelector = sel;
+            if (list && !(list.isConnected && list.lastElementChild && list.lastElementChild.contains(last))) {
+                window.__juneMessageList = null;  // the newest message is elsewhere
+            }
+            if (!window.__juneMessageList && nodes.length > 1) {
+                window.__juneMessageList = messageList(nodes[nodes.length - 2], last, selectors, sel);
+            }
+            return last;
+        }
+    }
+    return null;
+}
+function isBusy(selectors) {
+    for (const sel of selectors) {
+        let nodes;
+        try { nodes = document.querySelectorAll(sel); } catch (e) { continue; }
+        for (const el of nodes) {
+            if (el.getClientRects().length) return true;
+        }
+    }
+    return false;
+}
+function textHash(text) {
+    let h = 0x811c9dc5;
+    for (let i = 0; i < text.length; i++) {
+        h ^= text.charCodeAt(i);
+        h = Math.imul(h, 0x01000193);
+    }
+    return (h >>> 0).toString(16);
+}
+"""
+
+# Everything the polling loop needs, gathered in one round trip
+PROBE_SCRIPT = _DOM_HELPERS_JS + """
+const [selectors, busySelectors, question] = arguments;
+const node = lastMessage(selectors);
+const text = node ? node.textContent.trim() : '';
+let regenerate = false;
+for (const btn of document.querySelectorAll("[class*='stop'], [class*='regenerate'], button[aria-label*='stop']")) {
+    const label = (btn.textContent || '') + ' ' + (btn.getAttribute('aria-label') || '');
+    if (label.toLowerCase().includes('regenerate')) { regenerate = true; break; }
+}
+return {
+    hash: text ? textHash(text) : '',
+    length: text.length,
+    is_question: !!question && text === question.trim(),
+    typing: isBusy(busySelectors),
+    regenerate: regenerate,
+    loading: document.readyState !== 'complete' ||
+             document.querySelector('[class*="loading"]') !== null ||
+             document.querySelector('[class*="typing"]') !== null
+};
+"""
+
+# Text and HTML of the newest message, for saving the answer
+CAPTURE_SCRIPT = _DOM_HELPERS_JS + """
+const node = lastMessage(arguments[0], true);
+return node ? {text: node.innerText.trim(), html: node.outerHTML, selector: window.__juneLastSelector}
+            : {text: '', html: '', selector: null};
+"""
+
+def capture_response(driver, selectors=None):
+    """Fetch the last message's text and HTML (and the selector that found it) in one call."""
+    try:
+        return driver.execute_script(CAPTURE_SCRIPT, selectors or RESPONSE_SELECTORS) or {}
+    except WebDriverException as e:
+        print(f"⚠️ Could not capture response: {e.__class__.__name__}")
+        return {}
+
+def probe_page(driver, question=None, selectors=None):
+    """Take a compact snapshot of the chat page in a single WebDriver call."""
+    return driver.execute_script(PROBE_SCRIPT, selectors or RESPONSE_SELECTORS, TYPING_INDICATOR_SELECTORS, question)
+
+class CompletionDetector:
+    """
+    The polling mode's decision logic, kept free of WebDriver calls so it
+    can be replayed over recorded snapshots (see replay_traces.py). Feed it
+    each probe_page() snapshot with the seconds since the question was sent;
+    it returns why the answer counts as finished, or None to keep waiting.
+    """
+    def __init__(self, required_stable_checks=None, quiet_period=None):
+        self.required_stable_checks = required_stable_checks or REQUIRED_STABLE_CHECKS
+        self.quiet_period = OBSERVER_QUIET_PERIOD if quiet_period is None else quiet_period
+        self.first_hash = None
+        self.first_token = None  # seconds until the answer started to appear
+        self.last_hash = ""
+        self.changed_at = 0.0
+        self.stable_count = 0
+    
+    def feed(self, snapshot, elapsed):
+        if self.first_token is None:
+            if self.first_hash is None:
+                self.first_hash = snapshot["hash"]
+            elif snapshot["hash"] and snapshot["hash"] != self.first_hash and not snapshot["is_question"]:
+                self.first_token = elapsed
+        
+        # Check if text of the last message is stable (for long enough, however fast we poll)
+        if snapshot["is_question"]:
+            # Our own message echoed back is not an answer
+            self.stable_count = 0
+            self.last_hash = ""
+        elif snapshot["hash"]:
+            if snapshot["hash"] == self.last_hash:
+                self.stable_count += 1
+                if (self.stable_count >= self.required_stable_checks and
+                        elapsed - self.changed_at >= self.quiet_period):
+                    return "text stable"
+            else:
+                self.stable_count = 0
+                self.last_hash = snapshot["hash"]
+                self.changed_at = elapsed
+            
+            # Reset if still typing
+            if snapshot["typing"]:
+                self.stable_count = 0
+        
+        if snapshot["regenerate"]:
+            return "regenerate button appeared"
+        
+        if not snapshot["loading"] and self.last_hash:
+            self.stable_count += 1
+        else:
+            self.stable_count = 0
+        return None
+
+def record_snapshots(timeline, detected_at, timeout):
+    """Append one polled wait's snapshots to today's file in TRACE_RECORD_DIR."""
+    try:
+        os.makedirs(TRACE_RECORD_DIR, exist_ok=True)
+        path = os.path.join(TRACE_RECORD_DIR, f"snapshots-{datetime.now():%Y%m%d}.jsonl")
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(json.dumps({
+                "recorded_at": datetime.now().isoformat(),
+                "timeout": timeout,
+                "detected_at": detected_at,
+                "tail": TRACE_RECORD_TAIL,
+                "snapshots": timeline
+            }) + "\n")
+    except OSError as ex:
+        print(f"⚠️ Could not record snapshots: {ex}")
+
+def wait_for_response_improved(driver, timeout=10, check_interval=1, question=None, timings=None, selectors=None):
     """
     Improved response detection using multiple strategies.
+    Each check is one batched probe of the page, judged by a
+    CompletionDetector. `check_interval` may be a function of the seconds
+    waited so far. If `timings` is given it receives "first_token": seconds
+    until the answer started to appear. With TRACE_RECORD_DIR set, the
+    snapshots (plus TRACE_RECORD_TAIL seconds after the decision, to see
+    whether the answer really had finished) are saved for replay.
     """
-    print("⏳ Waiting for AI to finish responding...")
-    end_time = time.time() + timeout
-    last_text = ""
-    stable_count = 0
-    required_stable_checks = 3 
+    print(f"⏳ Waiting for AI to finish responding (up to {timeout:.0f}s)...")
+    start_time = time.time()
+    end_time = start_time + timeout
+    detector = CompletionDetector()
+    timeline = [] if TRACE_RECORD_DIR else None
+    detected_at = None
+    
+    def pause():
+        if callable(check_interval):
+            time.sleep(check_interval(time.time() - start_time))
+        else:
+            time.sleep(check_interval)
     
-    # Strategy 1: Try multiple selectors
     while time.time() < end_time:
-        for selector in RESPONSE_SELECTORS:
-            try:
-                # Get all message elements
-                messages = driver.find_elements(By.CSS_SELECTOR, selector)
-                if not messages:
-                    continue
-                
-                # Get the last message (most recent response)
-                current_text = messages[-1].text.strip()
-                
-                # Check if text is stable
-                if current_text and current_text == last_text:
-                    stable_count += 1
-                    if stable_count >= required_stable_checks:
-                        print("✅ Response finished (text stable).")
-                        return True
-                else:
-                    stable_count = 0
-                    last_text = current_text
-                
-                # Alternative: Check for typing indicators
-                typing_indicators = [
-                    "[class*='typing']",
-                    "[class*='loading']", 
-                    "[class*='pending']",
-                    "[class*='generating']",
-                    ".dots",
-                    ".spinner"
-                ]
-                
-                for indicator in typing_indicators:
-                    typing_elements = driver.find_elements(By.CSS_SELECTOR, indicator)
-                    if typing_elements and any(e.is_displayed() for e in typing_elements):
-                        stable_count = 0  # Reset if still typing
-                        break
-                
-                break  
-                
-            except Exception:
-                continue
+        try:
+            snapshot = probe_page(driver, question, selectors)
+        except WebDriverException:
+            pause()
+            continue
+        elapsed = time.time() - start_time
+        if timeline is not None:
+            timeline.append(dict(snapshot, t=round(elapsed, 3)))
+        if detected_at is not None:
+            if elapsed - detected_at >= TRACE_RECORD_TAIL:
+                break
+            pause()
+            continue
         
+        reason = detector.feed(snapshot, elapsed)
+        if timings is not None and "first_token" not in timings and detector.first_token is not None:
+            timings["first_token"] = detector.first_token
+        if reason:
+            print(f"✅ Response finished ({reason}).")
+            detected_at = elapsed
+            if timeline is None:
+                return True
+            end_time = max(end_time, time.time() + TRACE_RECORD_TAIL + 1)
+        
+        pause()
     
+    if timeline is not None:
+        record_snapshots(timeline, detected_at, timeout)
+    if detected_at is not None:
+        return True
+    print("⚠️ Timeout waiting for response - proceeding anyway.")
+    return False
+
+# Installs one MutationObserver per page on <main> (or <body>). The cached
+# message list is only a guess and may turn out to be one answer's element,
+# so it is not observed: a new answer outside it would go unnoticed. Later
+# calls reuse the observer; it is re-installed if <main> is replaced.
+_OBSERVER_INSTALL_JS = _DOM_HELPERS_JS + """
+function installWatch(selectors) {
+    const target = document.querySelector('main') || document.body;
+    let w = window.__juneWatch;
+    if (w && w.target === target) return w;
+    if (w) w.observer.disconnect();
+    w = window.__juneWatch = {target: target, listeners: w ? w.listeners : new Set(), baseline: w ? w.baseline : null};
+    w.observer = new MutationObserver(() => w.listeners.forEach(fn => fn()));
+    w.observer.observe(target, {childList: true, subtree: true, characterData: true});
+    return w;
+}
+"""
+
+# Remembers the last message before a question is sent, so the wait script
+# can tell the new answer apart from the previous one.
+OBSERVER_ARM_SCRIPT = _OBSERVER_INSTALL_JS + """
+const selectors = arguments[0];
+window.__juneMessageList = null;  // found afresh for every question
+const w = installWatch(selectors);
+const node = lastMessage(selectors, true);
+w.baseline = {node: node, text: node ? node.textContent : null};
+return true;
+"""
+
+# Resolves once the last message differs from the armed baseline and no
+# mutation has happened for the quiet period (and nothing looks busy).
+OBSERVER_WAIT_SCRIPT = _OBSERVER_INSTALL_JS + """
+const [selectors, busySelectors, quietMs, timeoutMs, question, done] = arguments;
+const start = performance.now();
+const w = installWatch(selectors);
+const base = w.baseline || {node: lastMessage(selectors), text: null};
+let finished = false, timer = null, deadline = null, firstToken = null;
+
+function finish(result) {
+    if (finished) return;
+    finished = true;
+    w.listeners.delete(schedule);
+    w.listeners.delete(watchFirstToken);
+    clearTimeout(timer);
+    clearTimeout(deadline);
+    if (result.done) w.baseline = null;
+    result.elapsed = (performance.now() - start) / 1000;
+    result.first_token = firstToken;
+    done(result);
+}
+function watchFirstToken() {
+    const node = lastMessage(selectors);
+    const text = node ? node.textContent.trim() : '';
+    if (!text || (node === base.node && node.textContent === base.text)) return;
+    if (question && text === question.trim()) return;
+    firstToken = (performance.now() - start) / 1000;
+    w.listeners.delete(watchFirstToken);
+}
+function check() {
+    const node = lastMessage(selectors);
+    const text = node ? node.textContent : '';
+    if (node === base.node && text === base.text) return;
+    if (!text.trim() || isBusy(busySelectors)) { schedule(); return; }
+    if (question && text.trim() === question.trim()) { schedule(); return; }  // our own message echoed
+    finish({done: true, length: text.length});
+}
+function schedule() {
+    clearTimeout(timer);
+    timer = setTimeout(check, quietMs);
+}
+
+w.listeners.add(schedule);
+w.listeners.add(watchFirstToken);
+deadline = setTimeout(() => finish({done: false}), timeoutMs);
+schedule();
+"""
+
+def arm_response_observer(driver, selectors=None):
+    """Record the current last message so the observer can spot the new answer."""
+    try:
+        driver.execute_script(OBSERVER_ARM_SCRIPT, selectors or RESPONSE_SELECTORS)
+        return True
+    except Exception:
+        return False
+
+def wait_for_response_observer(driver, timeout=10, quiet_period=None, question=None, timings=None, selectors=None):
+    """
+    Event-driven response detection using an in-page MutationObserver.
+    Returns in a single WebDriver call once the answer has been quiet
+    (long timeouts are waited out in slices of OBSERVER_MAX_WAIT).
+    """
+    if quiet_period is None:
+        quiet_period = OBSERVER_QUIET_PERIOD
+    print(f"⏳ Waiting for AI to finish responding (observer, up to {timeout:.0f}s)...")
+    waited = 0.0
+    while waited < timeout:
+        wait = min(OBSERVER_MAX_WAIT, timeout - waited)
+        driver.set_script_timeout(wait + 5)
+        result = driver.execute_async_script(
+            OBSERVER_WAIT_SCRIPT,
+            selectors or RESPONSE_SELECTORS,
+            TYPING_INDICATOR_SELECTORS,
+            int(quiet_period * 1000),
+            int(wait * 1000),
+            question
+        )
+        if timings is not None and "first_token" not in timings and result and result.get("first_token") is not None:
+            timings["first_token"] = waited + result["first_token"]
+        if result and result.get("done"):
+            print(f"✅ Response finished (quiet for {quiet_period:.1f}s after {waited + result['elapsed']:.1f}s).")
+            return True
+        waited += wait
+    print("⚠️ Timeout waiting for response - proceeding anyway.")
+    return False
+
+def network_events(driver):
+    """Network.* events from Chrome's performance log since the last read."""
+    events = []
+    for entry in driver.get_log("performance"):
         try:
-            stop_buttons = driver.find_elements(By.CSS_SELECTOR, "[class*='stop'], [class*='regenerate'], button[aria-label*='stop']")
-            if stop_buttons:
-                for btn in stop_buttons:
-                    if "regenerate" in btn.text.lower() or btn.get_attribute("aria-label") and "regenerate" in btn.get_attribute("aria-label").lower():
-                        print("✅ Response finished (regenerate button appeared).")
-                        return True
-        except:
-            pass
-        
-      
+            message = json.loads(entry["message"])["message"]
+        except (KeyError, TypeError, ValueError):
+            continue
+        if message.get("method", "").startswith("Network."):
+            events.append(message)
+    return events
+
+def arm_network_watch(driver):
+    """Discard older log entries so only requests made after this are watched."""
+    try:
+        driver.get_log("performance")
+        return True
+    except Exception:
+        return False
+
+def parse_sse_text(body):
+    """Join the text chunks of a server-sent-events answer stream."""
+    chunks = []
+    for line in body.splitlines():
+        if not line.startswith("data:"):
+            continue
+        data = line[5:].strip()
+        if not data or data == "[DONE]":
+            continue
         try:
-            is_loading = driver.execute_script("""
-                return document.readyState !== 'complete' || 
-                       document.querySelector('[class*="loading"]') !== null ||
-                       document.querySelector('[class*="typing"]') !== null;
-            """)
-            if not is_loading and last_text:
-                stable_count += 1
-            else:
-                stable_count = 0
-        except:
-            pass
+            event = json.loads(data)
+        except ValueError:
+            chunks.append(data)
+            continue
+        if isinstance(event, str):
+            chunks.append(event)
+            continue
+        if not isinstance(event, dict):
+            continue
+        choice = (event.get("choices") or [{}])[0]
+        if not isinstance(choice, dict):
+            choice = {}
+        delta = event.get("delta")
+        candidates = [
+            (choice.get("delta") or {}).get("content"),  # OpenAI-style deltas
+            choice.get("text"),
+            event.get("content"),
+            event.get("text"),
+            event.get("token"),
+            delta.get("text") if isinstance(delta, dict) else delta
+        ]
+        text = next((c for c in candidates if isinstance(c, str)), None)
+        if text:
+            chunks.append(text)
+    return "".join(chunks)
+
+def response_body_text(driver, request_id):
+    """The finished chat request's body as text ("" if Chrome no longer has it)."""
+    try:
+        result = driver.execute_cdp_cmd("Network.getResponseBody", {"requestId": request_id})
+    except WebDriverException:
+        return ""
+    body = result.get("body", "")
+    if result.get("base64Encoded"):
+        body = base64.b64decode(body).decode("utf-8", "replace")
+    return parse_sse_text(body) if "data:" in body else body
+
+def is_streaming_response(response):
+    """Whether a Network.responseReceived response is a stream (SSE or chunked)."""
+    headers = {name.lower(): str(value).lower() for name, value in (response.get("headers") or {}).items()}
+    return ("text/event-stream" in (response.get("mimeType") or "").lower() or
+            "text/event-stream" in headers.get("content-type", "") or
+            "chunked" in headers.get("transfer-encoding", ""))
+
+def wait_for_response_network(driver, timeout=10, question=None, timings=None, selectors=None, check_interval=1):
+    """
+    Waits for the chat API request (CHAT_API_URL_PATTERN) to finish, from
+    the network events in Chrome's performance log. Only a request whose
+    response streams counts; other matching requests are passed over.
+    Falls back to watching the page if no such request shows up or it
+    fails. With NETWORK_CAPTURE_BODY, `timings` also receives "network_text".
+    """
+    print(f"⏳ Waiting for the chat request to finish (network, up to {timeout:.0f}s)...")
+    pattern = re.compile(CHAT_API_URL_PATTERN)
+    start_time = time.time()
+    end_time = start_time + timeout
+    candidates = {}  # requestId -> sent timestamp, for matching requests with no response yet
+    request_id = None
+    sent_at = None  # Chrome's monotonic timestamp of the request
+    
+    def fall_back(reason):
+        print(f"⚠️ {reason}, watching the page instead.")
+        return wait_for_response_improved(driver, max(0, end_time - time.time()), check_interval,
+                                          question=question, timings=timings, selectors=selectors)
+    
+    while time.time() < end_time:
+        for event in network_events(driver):
+            params = event.get("params", {})
+            method = event["method"]
+            if request_id is None:
+                request = params.get("request", {})
+                if (method == "Network.requestWillBeSent" and request.get("method") == "POST" and
+                        pattern.search(request.get("url", ""))):
+                    candidates[params["requestId"]] = params.get("timestamp")
+                elif params.get("requestId") in candidates:
+                    if method == "Network.responseReceived" and is_streaming_response(params.get("response", {})):
+                        request_id = params["requestId"]
+                        sent_at = candidates[request_id]
+                    elif method in ("Network.responseReceived", "Network.loadingFinished",
+                                    "Network.loadingFailed"):
+                        del candidates[params["requestId"]]  # not the answer stream
+                continue
+            if params.get("requestId") != request_id:
+                continue
+            if method == "Network.dataReceived":
+                if timings is not None and "first_token" not in timings and sent_at is not None:
+                    timings["first_token"] = params["timestamp"] - sent_at
+            elif method == "Network.loadingFinished":
+                print(f"✅ Response finished (chat request done after {params['timestamp'] - sent_at:.1f}s).")
+                if NETWORK_CAPTURE_BODY and timings is not None:
+                    timings["network_text"] = response_body_text(driver, request_id)
+                time.sleep(NETWORK_RENDER_DELAY)
+                return True
+            elif method == "Network.loadingFailed":
+                return fall_back(f"Chat request failed ({params.get('errorText')})")
         
-        time.sleep(check_interval)
+        if request_id is None and time.time() - start_time > NETWORK_REQUEST_WAIT:
+            return fall_back("No streaming chat request seen")
+        time.sleep(NETWORK_POLL_INTERVAL)
     
     print("⚠️ Timeout waiting for response - proceeding anyway.")
     return False
 
+def wait_for_response(driver, timeout=10, question=None, timings=None, selectors=None, check_interval=1):
+    """Wait for the response using the configured DETECTION_MODE."""
+    if DETECTION_MODE == "network":
+        try:
+            return wait_for_response_network(driver, timeout, question=question, timings=timings,
+                                             selectors=selectors, check_interval=check_interval)
+        except WebDriverException as e:
+            print(f"⚠️ Network detection failed ({e.__class__.__name__}), falling back to polling.")
+    elif DETECTION_MODE == "observer":
+        try:
+            return wait_for_response_observer(driver, timeout, question=question, timings=timings,
+                                              selectors=selectors)
+        except WebDriverException as e:
+            print(f"⚠️ Observer detection failed ({e.__class__.__name__}), falling back to polling.")
+    return wait_for_response_improved(driver, timeout, check_interval, question=question, timings=timings,
+                                      selectors=selectors)
+
 def human_like_typing(element, text, min_delay=0.05, max_delay=0.15):
     """Type text in a more human-like manner."""
     for char in text:
-        element.send_keys(char)
+        element.send_keys(_as_keys(char))
         time.sleep(random.uniform(min_delay, max_delay))
         
         # Occasionally pause longer (thinking)
         if random.random() < 0.1:
             time.sleep(random.uniform(0.5, 1.0))
 
+def _as_keys(text):
+    """Newlines become Shift+Enter so multi-line prompts don't submit early."""
+    return text.replace("\n", Keys.SHIFT + Keys.ENTER + Keys.NULL)
+
+def bulk_typing(element, text):
+    """Type the whole text in a single send_keys call."""
+    element.send_keys(_as_keys(text))
+
+def chunked_typing(element, text, chunk_size=None):
+    """Type the text in a few large send_keys calls."""
+    chunk_size = chunk_size or INPUT_CHUNK_SIZE
+    for start in range(0, len(text), chunk_size):
+        element.send_keys(_as_keys(text[start:start + chunk_size]))
+
+# Sets the value the way a paste would, so React-style inputs notice it
+PASTE_SCRIPT = """
+const [element, text] = arguments;
+const proto = element.tagName === 'TEXTAREA' ? HTMLTextAreaElement.prototype : HTMLInputElement.prototype;
+Object.getOwnPropertyDescriptor(proto, 'value').set.call(element, text);
+element.dispatchEvent(new Event('input', {bubbles: true}));
+element.dispatchEvent(new Event('change', {bubbles: true}));
+"""
+
+def paste_typing(element, text):
+    """Set the text in one script call, like pasting a document."""
+    element.parent.execute_script(PASTE_SCRIPT, element, text)
+
+INPUT_STRATEGIES = {
+    "human": human_like_typing,
+    "bulk": bulk_typing,
+    "chunked": chunked_typing,
+    "paste": paste_typing
+}
+
+def enter_text(element, text, strategy=None):
+    """Type text with the given (or configured) input strategy."""
+    strategy = strategy or INPUT_STRATEGY
+    try:
+        type_text = INPUT_STRATEGIES[strategy]
+    except KeyError:
+        raise ValueError(f"Unknown input strategy: {strategy}")
+    type_text(element, text)
+
+def human_pause(min_seconds, max_seconds):
+    """Sleep for a random human-like interval (skipped when HUMAN_PAUSES is off)."""
+    if not HUMAN_PAUSES:
+        return 0
+    pause = random.uniform(min_seconds, max_seconds)
+    time.sleep(pause)
+    return pause
+
 def ask_login_check():
     """Ask user if logged in (pause until user confirms)."""
     while True:
@@ -344,208 +1933,1133 @@ def ask_login_check():
         else:
             print("⚠️ Please type 'yes' or 'no'.")
 
-# --- Main Automation ---
-def run_automation():
-    print("🚀 Starting enhanced automation...")
+# --- Profile Maintenance ---
+# Caches Chrome rebuilds on its own; cookies, local storage and IndexedDB are kept
+PROFILE_CACHE_DIRS = ["ShaderCache", "GrShaderCache", "GraphiteDawnCache", "component_crx_cache",
+                      "extensions_crx_cache", "BrowserMetrics", "Crashpad"]
+PROFILE_USER_CACHE_DIRS = ["Cache", "Code Cache", "GPUCache", "DawnCache", "DawnGraphiteCache",
+                           "DawnWebGPUCache", "Service Worker/CacheStorage", "Service Worker/ScriptCache",
+                           "blob_storage"]
+
+def profile_dir():
+    """The user-data-dir Chrome runs with (the tmpfs copy if PROFILE_RUNTIME_DIR is set)."""
+    return PROFILE_RUNTIME_DIR or PERSISTENT_PROFILE_DIR
+
+def _dir_size(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.lstat(os.path.join(root, name)).st_size
+            except OSError:
+                pass
+    return total
+
+def _profile_cache_paths(path):
+    """Cache folders inside a user-data-dir, for every Chrome profile in it."""
+    paths = [os.path.join(path, name) for name in PROFILE_CACHE_DIRS]
+    for entry in os.listdir(path) if os.path.isdir(path) else []:
+        if entry == "Default" or entry.startswith("Profile "):
+            paths.extend(os.path.join(path, entry, name) for name in PROFILE_USER_CACHE_DIRS)
+    return [p for p in paths if os.path.isdir(p)]
+
+# Chrome errors that point at the profile rather than the driver or the install
+PROFILE_ERROR_HINTS = ["crashed", "exited abnormally", "chrome failed to start", "devtoolsactiveport"]
+DRIVER_ERROR_HINTS = ["only supports chrome version", "cannot find chrome binary", "already in use",
+                      "unable to obtain driver", "permission denied"]
+
+def profile_in_use(path):
+    """Pid of a live Chrome holding the profile (its SingletonLock names it), or None."""
+    lock = os.path.join(path, "SingletonLock")
+    try:
+        pid = int(os.readlink(lock).rsplit("-", 1)[-1])
+    except (OSError, ValueError):
+        return None
+    try:
+        os.kill(pid, 0)
+        return pid
+    except OSError:
+        return None
+
+def started_by_this_script(pid):
+    """Whether the Chrome with this pid was launched with this script's flags."""
+    try:
+        with open(f"/proc/{pid}/cmdline", "rb") as f:
+            args = f.read().decode("utf-8", "replace").split("\0")
+    except OSError:
+        return False
+    return (f"--user-data-dir={profile_dir()}" in args and
+            "--disable-blink-features=AutomationControlled" in args)
+
+def profile_error(error):
+    """Whether a failed Chrome start looks like a damaged profile."""
+    message = str(error).lower()
+    if any(hint in message for hint in DRIVER_ERROR_HINTS):
+        return False
+    return any(hint in message for hint in PROFILE_ERROR_HINTS)
+
+def prune_profile(path=None):
+    """Delete the profile's cache folders; returns the bytes freed."""
+    path = path or profile_dir()
+    if profile_in_use(path):
+        print("⚠️ Chrome is using the profile, not pruning it.")
+        return 0
+    freed = 0
+    for cache in _profile_cache_paths(path):
+        size = _dir_size(cache)
+        shutil.rmtree(cache, ignore_errors=True)
+        freed += size - (_dir_size(cache) if os.path.exists(cache) else 0)
+    print(f"🧹 Pruned {freed / 1048576:.0f} MB of caches from {path}")
+    return freed
+
+def snapshot_profile(path=None, archive=None):
+    """Save the profile, without caches and lock files, as a .tar.gz archive."""
+    path = path or profile_dir()
+    archive = archive or PROFILE_SNAPSHOT_FILE
+    skip = {os.path.relpath(p, path) for p in _profile_cache_paths(path)}
     
-    # Load progress and model tracking
-    START_INDEX, model_tracking = load_progress()
+    def keep(info):
+        parts = info.name.split("/", 1)
+        relative = parts[1] if len(parts) > 1 else ""
+        if relative.startswith("Singleton") or any(relative == s or relative.startswith(s + "/") for s in skip):
+            return None
+        if not (info.isfile() or info.isdir() or info.issym()):
+            return None  # sockets and the like
+        return info
     
-    # Setup persistent profile
-    if not os.path.exists(PERSISTENT_PROFILE_DIR):
-        os.makedirs(PERSISTENT_PROFILE_DIR, exist_ok=True)
-        print(f"ℹ️ Created persistent profile folder: {PERSISTENT_PROFILE_DIR}")
+    temp = archive + ".tmp"
+    with tarfile.open(temp, "w:gz", compresslevel=6) as tar:
+        tar.add(path, arcname="profile", filter=keep)
+    os.replace(temp, archive)
+    print(f"📦 Saved profile snapshot to {archive} ({os.path.getsize(archive) / 1048576:.1f} MB)")
+
+def restore_profile(path=None, archive=None):
+    """Replace the profile with the snapshot (extracted beside it, then swapped in)."""
+    path = path or profile_dir()
+    archive = archive or PROFILE_SNAPSHOT_FILE
+    if not os.path.exists(archive):
+        print(f"⚠️ No profile snapshot at {archive}")
+        return False
+    staging = path.rstrip(os.sep) + ".restoring"
+    shutil.rmtree(staging, ignore_errors=True)
+    os.makedirs(staging)
+    with tarfile.open(archive, "r:gz") as tar:
+        if hasattr(tarfile, "data_filter"):
+            tar.extractall(staging, filter="data")
+        else:
+            tar.extractall(staging)
+    shutil.rmtree(path, ignore_errors=True)
+    os.replace(os.path.join(staging, "profile"), path)
+    shutil.rmtree(staging, ignore_errors=True)
+    print(f"♻️ Restored profile from {archive} into {path}")
+    return True
+
+def prepare_profile():
+    """Get the profile folder ready before Chrome starts."""
+    path = profile_dir()
+    if PROFILE_RUNTIME_DIR and not os.path.isdir(os.path.join(path, "Default")):
+        # Fresh tmpfs (e.g. after a reboot): fill it from the snapshot or the on-disk profile
+        if os.path.exists(PROFILE_SNAPSHOT_FILE):
+            restore_profile(path)
+        elif os.path.isdir(PERSISTENT_PROFILE_DIR):
+            shutil.rmtree(path, ignore_errors=True)
+            shutil.copytree(PERSISTENT_PROFILE_DIR, path, symlinks=True,
+                            ignore=shutil.ignore_patterns("Singleton*"))
+            print(f"ℹ️ Copied profile to {path}")
+    
+    if not os.path.exists(path):
+        os.makedirs(path, exist_ok=True)
+        print(f"ℹ️ Created persistent profile folder: {path}")
+        return
+    print(f"ℹ️ Using existing profile folder: {path}")
+    if PROFILE_PRUNE_OVER_MB is not None and not ATTACH_TO_RUNNING_BROWSER:
+        if _dir_size(path) > PROFILE_PRUNE_OVER_MB * 1048576:
+            prune_profile(path)
+
+def profile_command(args):
+    """python chat_automation.py profile prune|snapshot|restore [archive]"""
+    action = args[0] if args else None
+    archive = args[1] if len(args) > 1 else None
+    if action == "prune":
+        prune_profile()
+    elif action == "snapshot":
+        snapshot_profile(archive=archive)
+    elif action == "restore":
+        if profile_in_use(profile_dir()):
+            print("❌ Close Chrome before restoring the profile.")
+        else:
+            restore_profile(archive=archive)
     else:
-        print(f"ℹ️ Using existing profile folder: {PERSISTENT_PROFILE_DIR}")
+        print("Usage: python chat_automation.py profile prune|snapshot|restore [archive]")
+
+# --- Browser Startup ---
+def _version_of(command):
+    """Run `command` and pull a dotted version number out of its output."""
+    try:
+        output = subprocess.run(command, capture_output=True, text=True, timeout=10).stdout
+    except (OSError, subprocess.SubprocessError):
+        return None
+    match = re.search(r"\d+\.\d+\.\d+(\.\d+)?", output)
+    return match.group(0) if match else None
+
+def detect_chrome_version():
+    """Installed Chrome version, or None if it can't be determined."""
+    if sys.platform == "win32":
+        return _version_of(["reg", "query", r"HKEY_CURRENT_USER\Software\Google\Chrome\BLBeacon", "/v", "version"])
+    candidates = ["google-chrome", "google-chrome-stable", "chromium", "chromium-browser"]
+    if sys.platform == "darwin":
+        candidates.insert(0, "/Applications/Google Chrome.app/Contents/MacOS/Google Chrome")
+    for binary in candidates:
+        version = _version_of([binary, "--version"])
+        if version:
+            return version
+    return None
+
+def _major(version):
+    return version.split(".")[0] if version else None
+
+def resolve_driver_path():
+    """
+    Path to a chromedriver for the installed Chrome. The path is cached in
+    DRIVER_CACHE_FILE and reused without any network lookup while the binary
+    exists and its major version still matches Chrome's.
+    """
+    chrome_version = detect_chrome_version()
+    cache = {}
+    if os.path.exists(DRIVER_CACHE_FILE):
+        try:
+            with open(DRIVER_CACHE_FILE, "r", encoding="utf-8") as f:
+                cache = json.load(f)
+        except Exception:
+            cache = {}
+    
+    cached_path = cache.get("driver_path")
+    if cached_path and os.path.exists(cached_path):
+        driver_version = _version_of([cached_path, "--version"])
+        if driver_version and (chrome_version is None or _major(driver_version) == _major(chrome_version)):
+            print(f"♻️ Using cached chromedriver {driver_version}")
+            return cached_path
+        print(f"ℹ️ Cached chromedriver {driver_version} does not match Chrome {chrome_version}, resolving...")
+    
+    try:
+        driver_path = ChromeDriverManager().install()
+    except Exception as ex:
+        if cached_path and os.path.exists(cached_path):
+            print(f"⚠️ Could not resolve chromedriver ({ex}), trying the cached one")
+            return cached_path
+        raise
     
-    # Chrome options
+    cache = {
+        "driver_path": driver_path,
+        "driver_version": _version_of([driver_path, "--version"]),
+        "chrome_version": chrome_version,
+        "resolved_at": datetime.now().isoformat()
+    }
+    try:
+        with open(DRIVER_CACHE_FILE, "w", encoding="utf-8") as f:
+            json.dump(cache, f, indent=2)
+    except OSError as ex:
+        print(f"⚠️ Could not save driver cache: {ex}")
+    return driver_path
+
+def debugger_available(address=None):
+    """Is a Chrome already listening for DevTools connections at `address`?"""
+    address = address or DEBUGGER_ADDRESS
+    try:
+        with urllib.request.urlopen(f"http://{address}/json/version", timeout=1) as response:
+            return response.status == 200
+    except Exception:
+        return False
+
+def build_chrome_options(width, height, user_data_dir=None):
+    """Chrome options for launching with the persistent profile (or `user_data_dir`)."""
     options = webdriver.ChromeOptions()
-    options.add_argument(f"--user-data-dir={PERSISTENT_PROFILE_DIR}")
+    options.add_argument(f"--user-data-dir={user_data_dir or profile_dir()}")
     options.add_argument("--no-sandbox")
     options.add_argument("--disable-dev-shm-usage")
     options.add_argument("--disable-extensions")
-    options.add_argument("--remote-debugging-port=9222")
+    options.add_argument(f"--remote-debugging-port={DEBUGGER_ADDRESS.rsplit(':', 1)[-1]}")
     
     # Anti-detection measures
     options.add_experimental_option("excludeSwitches", ["enable-automation"])
     options.add_experimental_option("useAutomationExtension", False)
     options.add_argument("--disable-blink-features=AutomationControlled")
     
-    # Random window size for more human-like behavior
-    window_sizes = [(1920, 1080), (1680, 1050), (1440, 900), (1366, 768)]
-    width, height = random.choice(window_sizes)
     options.add_argument(f"--window-size={width},{height}")
     
     if HEADLESS:
         options.add_argument("--headless=new")
         options.add_argument("--disable-gpu")
     
-    driver = None
-    service = None
+    if ATTACH_TO_RUNNING_BROWSER:
+        # Keep Chrome alive after the script exits so the next run can attach
+        options.add_experimental_option("detach", True)
     
+    if DETECTION_MODE == "network":
+        # Network events in the performance log, for wait_for_response_network
+        options.set_capability("goog:loggingPrefs", {"performance": "ALL"})
+        options.add_experimental_option("perfLoggingPrefs", {"enableNetwork": True, "enablePage": False})
+    
+    if LEAN_PROFILE:
+        options.add_experimental_option("prefs", {
+            "profile.managed_default_content_settings.images": 2,
+            "profile.default_content_setting_values.notifications": 2,
+            "profile.default_content_setting_values.media_stream": 2
+        })
+        options.add_argument("--mute-audio")
+    return options
+
+def _site_of(host):
+    """Registrable part of a host ("cdn.askjune.ai:443" -> "askjune.ai"), roughly."""
+    return ".".join(host.split(":")[0].split(".")[-2:])
+
+def lean_blocked_urls(hosts):
+    """URL patterns to block: heavy file types, and known third-party hosts not allowed."""
+    own_site = _site_of(AI_WEBSITE_URL.split("/")[2])
+    allowed = {_site_of(host) for host in LEAN_ALLOWED_HOSTS} | {own_site}
+    third_party = sorted(host for host in hosts if _site_of(host) not in allowed)
+    return LEAN_BLOCKED_URLS + [f"*://{host}/*" for host in third_party]
+
+def apply_lean_blocking(driver, hosts):
+    """Ask Chrome (over CDP) to drop requests the chat doesn't need."""
     try:
-        service = Service(ChromeDriverManager().install())
-        driver = webdriver.Chrome(service=service, options=options)
+        driver.execute_cdp_cmd("Network.enable", {})
+        driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": lean_blocked_urls(hosts)})
+        return True
+    except WebDriverException as e:
+        print(f"⚠️ Could not block resources: {e.__class__.__name__}")
+        return False
+
+def start_driver(options):
+    """
+    Attach to a running Chrome when allowed and available, otherwise launch
+    one. Returns (driver, keep_browser): whether Chrome should be left
+    running on exit for the next run to attach to.
+    """
+    service = Service(resolve_driver_path())
+    if ATTACH_TO_RUNNING_BROWSER and debugger_available():
+        print(f"🔗 Attaching to running Chrome at {DEBUGGER_ADDRESS}...")
+        attach_options = webdriver.ChromeOptions()
+        attach_options.debugger_address = DEBUGGER_ADDRESS
+        return webdriver.Chrome(service=service, options=attach_options), True
+    return webdriver.Chrome(service=service, options=options), ATTACH_TO_RUNNING_BROWSER
+
+def chrome_starts_without_profile(width, height):
+    """Whether Chrome starts on an empty temporary profile, i.e. the real profile is to blame."""
+    user_data_dir = tempfile.mkdtemp(prefix="june_profile_check_")
+    driver = None
+    try:
+        options = build_chrome_options(width, height, user_data_dir)
+        options.add_experimental_option("detach", False)
+        driver = webdriver.Chrome(service=Service(resolve_driver_path()), options=options)
+        return True
+    except WebDriverException as e:
+        print(f"ℹ️ Chrome doesn't start on an empty profile either ({e.__class__.__name__}).")
+        return False
+    finally:
+        if driver is not None:
+            try:
+                driver.quit()
+            except Exception:
+                pass
+        shutil.rmtree(user_data_dir, ignore_errors=True)
+
+# --- Browser Session ---
+# Ways to find the input box, best first
+INPUT_BOX_SELECTORS = [
+    (By.XPATH, INPUT_BOX_XPATH),
+    (By.CSS_SELECTOR, "textarea[placeholder*='Type']"),
+    (By.CSS_SELECTOR, "textarea[placeholder*='question']"),
+    (By.CSS_SELECTOR, "textarea[placeholder*='Ask']"),
+    (By.CSS_SELECTOR, "input[type='text'][placeholder*='Type']"),
+    (By.TAG_NAME, "textarea")
+]
+
+SEND_BUTTON_SELECTORS = [
+    (By.XPATH, SEND_BUTTON_XPATH),
+    (By.CSS_SELECTOR, "button[aria-label='submit']"),
+    (By.CSS_SELECTOR, "button[type='submit']"),
+    (By.XPATH, "//button[contains(@class, 'send')]"),
+    (By.CSS_SELECTOR, "button svg[class*='send']")
+]
+
+# Identifies the deployed build of the site from its script/style URLs
+SITE_FINGERPRINT_SCRIPT = _DOM_HELPERS_JS + """
+const urls = Array.from(document.querySelectorAll('script[src], link[rel="stylesheet"][href]'))
+    .map(e => e.src || e.href).sort();
+return urls.length ? location.host + ':' + textHash(urls.join('|')) : null;
+"""
+
+def site_fingerprint(driver):
+    try:
+        return driver.execute_script(SITE_FINGERPRINT_SCRIPT)
+    except WebDriverException:
+        return None
+
+class SelectorRegistry:
+    """
+    Remembers which strategy found each page element, tries it first, and
+    only walks the rest of the fallback chain when it stops matching. The
+    winners are kept in the state store and forgotten when the site's build
+    changes.
+    """
+    def __init__(self, chains):
+        self.chains = chains
+        saved = get_state_store().get("selectors", {})
+        self.fingerprint = saved.get("fingerprint")
+        self.winners = {name: tuple(winner) for name, winner in saved.get("winners", {}).items()}
+    
+    def _save(self):
+        get_state_store().update({"selectors": {
+            "fingerprint": self.fingerprint,
+            "winners": {name: list(winner) for name, winner in self.winners.items()}
+        }})
+    
+    def check_site(self, driver):
+        """Forget learned selectors if the site has been redeployed."""
+        fingerprint = site_fingerprint(driver)
+        if not fingerprint or fingerprint == self.fingerprint:
+            return
+        if self.fingerprint and self.winners:
+            print("ℹ️ Site has changed, re-learning selectors")
+        self.fingerprint = fingerprint
+        self.winners = {}
+        self._save()
+    
+    def ordered(self, name):
+        """The chain for `name`, with the last winner first."""
+        chain = self.chains[name]
+        winner = self.winners.get(name)
+        if winner in chain:
+            return [winner] + [entry for entry in chain if entry != winner]
+        return list(chain)
+    
+    def css_chain(self, name):
+        return [selector for by, selector in self.ordered(name) if by == By.CSS_SELECTOR]
+    
+    def learn(self, name, winner):
+        if winner in self.chains[name] and self.winners.get(name) != winner:
+            self.winners[name] = winner
+            self._save()
+    
+    def find(self, driver, name, timeout=0, accept=None):
+        """
+        Find element `name`, trying each strategy once without waiting.
+        If nothing matches and `timeout` is set, wait that long for any of them.
+        """
+        def attempt(_=None):
+            for by, selector in self.ordered(name):
+                try:
+                    elements = driver.find_elements(by, selector)
+                    if elements and (accept is None or accept(elements[0])):
+                        self.learn(name, (by, selector))
+                        return elements[0]
+                except WebDriverException:
+                    continue
+            return None
+        
+        element = attempt()
+        if element is None and timeout:
+            try:
+                element = WebDriverWait(driver, timeout).until(attempt)
+            except TimeoutException:
+                element = None
+        return element
+
+# Size of the chat page; performance.memory is Chrome-only and may be missing
+PAGE_STATS_SCRIPT = """
+const memory = performance.memory;
+return {
+    nodes: document.getElementsByTagName('*').length,
+    heap_mb: memory ? Math.round(memory.usedJSHeapSize / 1048576) : null
+};
+"""
+
+# Load time, transferred size, JS heap and hosts contacted by the page just loaded
+PAGE_LOAD_SCRIPT = """
+const nav = performance.getEntriesByType('navigation')[0];
+const resources = performance.getEntriesByType('resource');
+const hosts = new Set();
+let bytes = nav ? nav.transferSize || 0 : 0;
+for (const entry of resources) {
+    bytes += entry.transferSize || 0;
+    try { hosts.add(new URL(entry.name).host); } catch (e) {}
+}
+const memory = performance.memory;
+return {
+    load_ms: nav && nav.loadEventEnd ? Math.round(nav.loadEventEnd - nav.startTime) : null,
+    transfer_kb: Math.round(bytes / 1024),
+    heap_mb: memory ? Math.round(memory.usedJSHeapSize / 1048576) : null,
+    requests: resources.length,
+    hosts: Array.from(hosts)
+};
+"""
+
+class BrowserSession:
+    """
+    Owns the driver and the chat page (wait, input box), and can tell when
+    the browser has died or hung and relaunch it with the persistent profile.
+    """
+    def __init__(self, instr):
+        self.instr = instr
+        self.driver = None
+        self.wait = None
+        self.input_box = None
+        self.keep_browser = False
+        self.restarts = 0
+        self.profile_restored = False
+        self.conversation_questions = 0
+        self.baseline_page = {}  # page_stats() when the conversation began
+        self.selectors = SelectorRegistry({
+            "input_box": INPUT_BOX_SELECTORS,
+            "send_button": SEND_BUTTON_SELECTORS,
+            "response": [(By.CSS_SELECTOR, selector) for selector in RESPONSE_SELECTORS]
+        })
+        
+        # Random window size for more human-like behavior
+        window_sizes = [(1920, 1080), (1680, 1050), (1440, 900), (1366, 768)]
+        self.width, self.height = random.choice(window_sizes)
+    
+    def start(self, allow_restore=True):
+        """
+        Launch (or attach to) Chrome and open the chat page. If Chrome
+        crashes on the profile, but starts on an empty temporary one, the
+        snapshot is restored once per run (only when `allow_restore`;
+        restarts never restore).
+        """
+        options = build_chrome_options(self.width, self.height)
+        try:
+            self.driver, self.keep_browser = start_driver(options)
+        except WebDriverException as e:
+            if not (allow_restore and PROFILE_RESTORE_IF_BROKEN and not self.profile_restored and
+                    not ATTACH_TO_RUNNING_BROWSER and os.path.exists(PROFILE_SNAPSHOT_FILE) and
+                    profile_error(e)):
+                raise
+            self.profile_restored = True
+            self.driver = None
+            print(f"⚠️ Chrome crashed on start ({e.__class__.__name__}), checking whether the profile is damaged...")
+            pid = profile_in_use(profile_dir())
+            if pid:
+                if not started_by_this_script(pid):
+                    print("❌ Another Chrome is using the profile, not touching it.")
+                    raise
+                _kill_profile_browsers()
+                try:
+                    # Our own hung Chrome may have been all that was wrong
+                    self.driver, self.keep_browser = start_driver(options)
+                except WebDriverException:
+                    self.driver = None
+            if self.driver is None:
+                if not chrome_starts_without_profile(self.width, self.height):
+                    raise e  # not the profile (display, sandbox, install...): leave it alone
+                print("⚠️ Chrome only fails on this profile, restoring the profile snapshot...")
+                broken = f"{profile_dir().rstrip(os.sep)}.broken-{datetime.now():%Y%m%d-%H%M%S}"
+                if os.path.exists(profile_dir()):
+                    os.replace(profile_dir(), broken)
+                    print(f"ℹ️ The old profile was moved to {broken}")
+                restore_profile()
+                self.driver, self.keep_browser = start_driver(options)
+        self.instr.attach(self.driver)
+        for hook in DRIVER_HOOKS:
+            hook(self.driver)
+        if LEAN_PROFILE:
+            apply_lean_blocking(self.driver, get_state_store().get("page_loads", {}).get("hosts", []))
         
         # Hide webdriver detection
-        driver.execute_script("""
+        self.driver.execute_script("""
             Object.defineProperty(navigator, 'webdriver', {get: () => undefined});
             Object.defineProperty(navigator, 'plugins', {get: () => [1, 2, 3, 4, 5]});
             Object.defineProperty(navigator, 'languages', {get: () => ['en-US', 'en']});
         """)
         
-        print(f"🌍 Navigating to {AI_WEBSITE_URL}...")
-        driver.get(AI_WEBSITE_URL)
+        if self.keep_browser and self.driver.current_url.startswith(AI_WEBSITE_URL):
+            print("✅ Chat page already open.")
+        else:
+            print(f"🌍 Navigating to {AI_WEBSITE_URL}...")
+            self.driver.get(AI_WEBSITE_URL)
         
-        wait = WebDriverWait(driver, 60)
-        wait.until(EC.presence_of_element_located((By.TAG_NAME, "body")))
+        self.wait = WebDriverWait(self.driver, 60)
+        self.wait.until(EC.presence_of_element_located((By.TAG_NAME, "body")))
+        self.selectors.check_site(self.driver)
+        self.conversation_questions = 0
+        self.baseline_page = self.page_stats()
+        self.report_page_load()
+    
+    def locate_input_box(self, wait=True):
+        """Find the input box, waiting up to a minute for the page if `wait`."""
+        input_box = self.selectors.find(self.driver, "input_box", timeout=60 if wait else 0)
+        if input_box is not None:
+            self.input_box = input_box
+            if wait:
+                print(f"✅ Input box found using: {self.selectors.winners['input_box'][1]}")
+        return input_box
+    
+    def page_stats(self):
+        """Element count and JS heap (MB) of the chat page, {} if unavailable."""
+        try:
+            return self.driver.execute_script(PAGE_STATS_SCRIPT) or {}
+        except WebDriverException:
+            return {}
+    
+    def conversation_full(self, stats):
+        """
+        Why the current conversation should be replaced, or None. Page sizes
+        are compared with the size when the conversation began.
+        """
+        if ROTATE_CONVERSATION_EVERY and self.conversation_questions >= ROTATE_CONVERSATION_EVERY:
+            return f"{self.conversation_questions} questions"
+        if self.conversation_questions < ROTATE_MIN_QUESTIONS:
+            return None
+        nodes = stats.get("nodes", 0) - self.baseline_page.get("nodes", 0)
+        if ROTATE_MAX_DOM_NODES and nodes >= ROTATE_MAX_DOM_NODES:
+            return f"{nodes} page elements added"
+        heap = (stats.get("heap_mb") or 0) - (self.baseline_page.get("heap_mb") or 0)
+        if ROTATE_MAX_HEAP_MB and stats.get("heap_mb") is not None and heap >= ROTATE_MAX_HEAP_MB:
+            return f"page heap up {heap:.0f} MB"
+        return None
+    
+    def new_conversation(self):
+        """Load an empty conversation, which also frees the old page's memory."""
+        self.driver.get(NEW_CHAT_URL or AI_WEBSITE_URL)
+        self.wait.until(EC.presence_of_element_located((By.TAG_NAME, "body")))
+        try:
+            # A client-side route change keeps the old page's cached message list
+            self.driver.execute_script("window.__juneMessageList = null;")
+        except WebDriverException:
+            pass
+        self.conversation_questions = 0
+        self.baseline_page = self.page_stats()
+        self.report_page_load()
+        return self.locate_input_box()
+    
+    def report_page_load(self):
+        """
+        Record how heavy the page load was, per profile ("lean" or "full"),
+        remember the hosts it contacted, and print what lean mode saves.
+        """
+        try:
+            load = self.driver.execute_script(PAGE_LOAD_SCRIPT)
+        except WebDriverException:
+            return
+        if not isinstance(load, dict):
+            return
+        state = copy.deepcopy(get_state_store().get("page_loads", {}))
+        known_hosts = set(state.get("hosts", []))
+        new_hosts = set(load.get("hosts") or []) - known_hosts
+        state["hosts"] = sorted(known_hosts | new_hosts)
+        
+        mode = "lean" if LEAN_PROFILE else "full"
+        totals = state.setdefault(mode, {"count": 0})
+        totals["count"] += 1
+        for key in ("load_ms", "transfer_kb", "heap_mb", "requests"):
+            if load.get(key) is not None:
+                # Running mean over the loads seen in this mode
+                previous = totals.get(key, load[key])
+                totals[key] = round(previous + (load[key] - previous) / totals["count"], 1)
+        try:
+            get_state_store().update({"page_loads": state})
+        except Exception as ex:
+            print(f"⚠️ Could not save page load stats: {ex}")
+        
+        summary = (f"{(load.get('load_ms') or 0) / 1000:.1f}s, {load.get('transfer_kb')} KB, "
+                   f"{load.get('heap_mb')} MB heap")
+        other = state.get("full" if LEAN_PROFILE else "lean")
+        if LEAN_PROFILE and other and other.get("load_ms") is not None and totals.get("load_ms") is not None:
+            print(f"🪶 Lean page load: {summary} (saves {(other['load_ms'] - totals['load_ms']) / 1000:.1f}s, "
+                  f"{other.get('transfer_kb', 0) - totals.get('transfer_kb', 0):.0f} KB, "
+                  f"{(other.get('heap_mb') or 0) - (totals.get('heap_mb') or 0):.0f} MB heap on average)")
+        else:
+            print(f"ℹ️ Page load ({mode} profile): {summary}")
+        if LEAN_PROFILE and new_hosts and lean_blocked_urls(new_hosts)[len(LEAN_BLOCKED_URLS):]:
+            apply_lean_blocking(self.driver, state["hosts"])
+    
+    def find_send_button(self):
+        """First enabled send button, or None to fall back to the Enter key."""
+        return self.selectors.find(self.driver, "send_button", accept=lambda el: el.is_enabled())
+    
+    def is_healthy(self, timeout=None):
+        """Probe the browser; False if it errors or doesn't answer in time."""
+        if self.driver is None:
+            return False
+        result = {}
+        
+        def probe():
+            try:
+                result["ok"] = self.driver.execute_script("return document.readyState") is not None
+            except Exception:
+                result["ok"] = False
+        
+        thread = threading.Thread(target=probe, daemon=True)
+        thread.start()
+        thread.join(timeout or HEALTH_CHECK_TIMEOUT)
+        return result.get("ok", False)
+    
+    def close(self, force=False):
+        """Quit the browser (or just detach from it when it should be kept)."""
+        if self.driver is None:
+            return
+        driver, self.driver, self.input_box = self.driver, None, None
+        if self.keep_browser and not force:
+            try:
+                driver.service.stop()
+            except:
+                pass
+            print(f"\n🔗 Browser left running on {DEBUGGER_ADDRESS}")
+            return
+        
+        # quit() can hang on a dead browser, so give it a bounded time
+        thread = threading.Thread(target=lambda: driver.quit(), daemon=True)
+        thread.start()
+        thread.join(HEALTH_CHECK_TIMEOUT)
+        if force and thread.is_alive():
+            _kill_profile_browsers()
+    
+    def restart(self):
+        """Relaunch Chrome and get back to a usable input box."""
+        while self.restarts < MAX_BROWSER_RESTARTS:
+            self.restarts += 1
+            self.instr.event("restart", f"🔁 Restarting browser ({self.restarts}/{MAX_BROWSER_RESTARTS})...")
+            self.close(force=True)
+            try:
+                self.start(allow_restore=False)
+                if self.locate_input_box():
+                    return True
+                print("⚠️ Input box not found after restart.")
+            except Exception as e:
+                print(f"⚠️ Restart failed: {e}")
+            time.sleep(min(60, 5 * self.restarts))
+        return False
+
+def _kill_profile_browsers():
+    """Kill Chrome processes still holding the persistent profile (best effort)."""
+    if sys.platform == "win32":
+        return
+    try:
+        # "--" so pkill doesn't read the pattern as one of its own options
+        subprocess.run(["pkill", "-f", "--", re.escape(f"--user-data-dir={profile_dir()}")], timeout=10)
+    except (OSError, subprocess.SubprocessError):
+        pass
+
+def write_dead_letter(index, question_id, question, attempts, error):
+    """Record a question that kept failing so it can be looked at later."""
+    entry = {
+        "index": index,
+        "question_id": question_id,
+        "question": question,
+        "attempts": attempts,
+        "error": error,
+        "at": datetime.now().isoformat()
+    }
+    try:
+        with open(DEAD_LETTER_FILE, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+    except OSError as ex:
+        print(f"⚠️ Could not write dead letter: {ex}")
+
+# --- Main Automation ---
+def send_prompt(session, model_manager, instr, prompt, label, questions=1):
+    """
+    Type and send one prompt, wait for the answer and capture it. Returns
+    (response, completed, sent_at). A prompt packing several `questions`
+    gets that much more time and is left out of the latency profile.
+    """
+    driver = session.driver
+    response_selectors = session.selectors.css_chain("response")
+    
+    # Check if model switch needed
+    if model_manager.should_switch_model():
+        with instr.span("model_switch"):
+            instr.event("model_switch", "🔄 Model usage limit approaching, switching...")
+            if model_manager.get_available_model() is None:
+                model_manager.wait_for_available_model()
+            if not model_manager.switch_model():
+                instr.event("model_switch_failed", "⚠️ Could not switch model, continuing with current")
+            human_pause(3, 5)
+    
+    instr.event("question", f"\n❓ Sending {label}")
+    
+    # Clear and type question (human-like)
+    with instr.span("clear"):
+        session.input_box.clear()
+        human_pause(0.5, 1)
+    
+    # Model usage counts from typing until the answer is done
+    model_manager.begin_usage()
+    
+    # Type the question (human-like unless INPUT_STRATEGY says otherwise)
+    with instr.span("typing"):
+        enter_text(session.input_box, prompt)
+        human_pause(0.5, 1.5)
+    
+    # Send question
+    with instr.span("send"):
+        send_button = session.find_send_button()
+        
+        if DETECTION_MODE == "observer":
+            arm_response_observer(driver, response_selectors)
+        elif DETECTION_MODE == "network":
+            arm_network_watch(driver)
+        sent_at = datetime.now()
+        
+        if send_button:
+            send_button.click()
+        else:
+            session.input_box.send_keys(Keys.RETURN)
+    
+    instr.event("sent", "✅ Question sent.")
+    
+    # Wait for response, as long as this model usually needs
+    model = model_manager.current_model
+    latency = model_manager.latency
+    timings = {}
+    wait_started = time.monotonic()
+    with instr.span("completion"):
+        response_received = wait_for_response(
+            driver, latency.timeout_for(model) * questions, question=prompt, timings=timings,
+            selectors=response_selectors, check_interval=lambda elapsed: latency.poll_interval(model, elapsed)
+        )
+    waited = time.monotonic() - wait_started
+    model_manager.end_usage()
+    if "first_token" in timings:
+        instr.split_span("completion", "first_token", timings["first_token"])
+    
+    # A timeout may just be a slow answer, or a browser that stopped responding
+    if not response_received and not session.is_healthy():
+        raise WebDriverException("browser stopped responding")
+    if questions == 1:
+        latency.record(model, waited, timings.get("first_token"), completed=response_received)
+    
+    # Save the answer
+    with instr.span("persist"):
+        response = capture_response(driver, response_selectors)
+        if not response and not session.is_healthy():
+            raise WebDriverException("browser stopped responding")
+        if not response.get("text") and timings.get("network_text"):
+            # The page's markup wasn't recognised, but the stream was
+            response = {"text": timings["network_text"], "html": "", "selector": None}
+        if response.get("text") and response.get("selector"):
+            session.selectors.learn("response", (By.CSS_SELECTOR, response["selector"]))
+    return response, response_received, sent_at
+
+def ask_question(session, model_manager, instr, postprocessor, i, question_id, question):
+    """Type, send and wait for one question, then save its answer."""
+    response, response_received, sent_at = send_prompt(session, model_manager, instr, question,
+                                                       f"Q{i}: {question}")
+    with instr.span("persist"):
+        postprocessor.submit(
+            i, question_id, question, model_manager.current_model,
+            response, sent_at, datetime.now(),
+            completed=response_received
+        )
+    return response_received
+
+# "Answer 3:" (possibly bold or a heading) starts the answer to question 3
+ANSWER_MARKER = re.compile(r"^[ \t*#>_]*answer\s*(\d+)\s*[:.)\]-]", re.IGNORECASE | re.MULTILINE)
+# Plain "3." / "3)" numbering, only trusted when it runs exactly 1..N
+NUMBER_MARKER = re.compile(r"^[ \t*#]*(\d+)\s*[.):]\s", re.MULTILINE)
+
+def batchable(question):
+    """Short single-line questions can share a prompt."""
+    return "\n" not in question and len(question) <= BATCH_MAX_QUESTION_CHARS
+
+def pack_questions(questions):
+    """One numbered prompt asking all the questions."""
+    return "\n".join([BATCH_PROMPT_HEADER, ""] + [f"{n}. {q}" for n, q in enumerate(questions, start=1)])
+
+def split_answers(text, count):
+    """
+    Answers by question number (from 1) in a reply to pack_questions(); unfound ones are left out.
+    Each answer ends at the next marker whatever its number, and numbers that repeat or come
+    out of order are dropped so those questions get asked on their own.
+    """
+    starts = [(int(m.group(1)), m.start(), m.end()) for m in ANSWER_MARKER.finditer(text)]
+    if not starts:
+        numbered = list(NUMBER_MARKER.finditer(text))
+        if [int(m.group(1)) for m in numbered] == list(range(1, count + 1)):
+            starts = [(int(m.group(1)), m.start(), m.end()) for m in numbered]
+
+    seen = Counter(n for n, _, _ in starts)
+    answers = {}
+    previous = 0
+    for k, (n, _, end) in enumerate(starts):
+        in_order = n > previous
+        previous = max(previous, n)
+        if not in_order or seen[n] > 1 or n > count:
+            continue
+        stop = starts[k + 1][1] if k + 1 < len(starts) else len(text)
+        answer = text[end:stop].strip().lstrip("*_ ").strip()
+        if answer:
+            answers[n] = answer
+    return answers
+
+def gather_batch(first, pending, model):
+    """
+    Take more pending questions to pack with `first`, within BATCH_SIZE
+    and the model's prompt budget. Returns (batch, held), where `held` is a
+    question that was taken but didn't fit (None if there isn't one).
+    """
+    batch = [first]
+    size = len(pack_questions([first[2]]))
+    budget = BATCH_MODEL_CHAR_BUDGETS.get(model, BATCH_CHAR_BUDGET)
+    while len(batch) < BATCH_SIZE:
+        item = next(pending, None)
+        if item is None:
+            return batch, None
+        extra = len(item[2]) + len(f"\n{len(batch) + 1}. ")
+        if not batchable(item[2]) or size + extra > budget:
+            return batch, item
+        batch.append(item)
+        size += extra
+    return batch, None
+
+def ask_batch(session, model_manager, instr, postprocessor, batch):
+    """
+    Send several (index, question_id, question) items as one numbered
+    prompt and save each answer on its own. Returns the items whose answer
+    couldn't be found in the reply.
+    """
+    first, last = batch[0][0] + 1, batch[-1][0] + 1
+    response, response_received, sent_at = send_prompt(
+        session, model_manager, instr, pack_questions([question for _, _, question in batch]),
+        f"Q{first}-Q{last} as one prompt ({len(batch)} questions)", questions=len(batch)
+    )
+    answers = split_answers(response.get("text", ""), len(batch)) if response_received else {}
+    missing = []
+    with instr.span("persist"):
+        finished_at = datetime.now()
+        for n, (index, question_id, question) in enumerate(batch, start=1):
+            if n in answers:
+                postprocessor.submit(index + 1, question_id, question, model_manager.current_model,
+                                     {"text": answers[n], "html": ""}, sent_at, finished_at)
+            else:
+                missing.append((index, question_id, question))
+    if missing:
+        instr.event("batch_split", f"✂️ No answer found for {len(missing)} of {len(batch)} questions, "
+                                   f"they will be asked one by one", missing=len(missing))
+    return missing
+
+def run_automation():
+    print("🚀 Starting enhanced automation...")
+    
+    # Load progress and model tracking
+    START_INDEX, model_tracking = load_progress()
+    ensure_questions_file()
+    questions = QuestionSource()
+    
+    # Setup persistent profile
+    prepare_profile()
+    
+    answer_store = AnswerStore()
+    answer_cache = AnswerCache()
+    postprocessor = PostProcessor(answer_store, answer_cache)
+    instr = Instrumentation()
+    session = BrowserSession(instr)
+    
+    # Questions that failed and should be asked again, kept across runs
+    retry_queue = deque(tuple(item) for item in get_state_store().get("retry_queue", []))
+    
+    def save_retry_queue():
+        postprocessor.checkpoint({"retry_queue": [list(item) for item in retry_queue]})
+    
+    def save_progress(index):
+        postprocessor.checkpoint({"last_index": index})
+    
+    try:
+        session.start()
         
         # Random delay (human-like)
-        time.sleep(random.uniform(3, 5))
+        human_pause(3, 5)
         
         # Login check
-        ask_login_check()
+        if LOGIN_CHECK:
+            ask_login_check()
         
         # Initialize model manager
-        model_manager = ModelManager(driver, wait)
+        model_manager = ModelManager(session.driver, session.wait, model_tracking)
         
         # Initial model setup
         if model_manager.should_switch_model():
             model_manager.switch_model()
         
-        # Find input box with multiple strategies
-        selectors_to_try = [
-            (By.XPATH, INPUT_BOX_XPATH),
-            (By.CSS_SELECTOR, "textarea[placeholder*='Type']"),
-            (By.CSS_SELECTOR, "textarea[placeholder*='question']"),
-            (By.CSS_SELECTOR, "textarea[placeholder*='Ask']"),
-            (By.CSS_SELECTOR, "input[type='text'][placeholder*='Type']"),
-            (By.TAG_NAME, "textarea")
-        ]
-        
-        input_box = None
-        for by, selector in selectors_to_try:
-            try:
-                input_box = wait.until(EC.presence_of_element_located((by, selector)))
-                print(f"✅ Input box found using: {selector}")
-                break
-            except TimeoutException:
-                continue
-        
-        if not input_box:
+        if not session.locate_input_box():
             print("❌ Could not find input box. Exiting.")
             return
         
         print(f"✅ Resuming from Q{START_INDEX + 1}...")
+        if retry_queue:
+            print(f"🔁 {len(retry_queue)} question(s) waiting to be retried")
         
         # Main question loop
-        session_start = time.time()
         questions_this_session = 0
+        pending = questions.iter_from(START_INDEX)
+        held = None  # taken from `pending` for a batch it didn't fit in
+        
+        def reuse_cached(i, question_id, question):
+            """Handle a question this model already answered; False if it hasn't."""
+            if ANSWER_CACHE_POLICY == "off" or model_manager.should_switch_model():
+                return False
+            cached = answer_cache.get(question, model_manager.current_model)
+            if cached is None:
+                return False
+            instr.event("cache_hit", f"♻️ Q{i} already answered by {model_manager.current_model} "
+                                     f"({ANSWER_CACHE_POLICY})")
+            if ANSWER_CACHE_POLICY == "reuse":
+                with instr.span("persist"):
+                    now = datetime.now()
+                    postprocessor.submit(i, question_id, question, model_manager.current_model,
+                                         cached, now, now, cached=True)
+            return True
         
-        for i, question in enumerate(QUESTIONS[START_INDEX:], start=START_INDEX + 1):
+        while True:
+            if retry_queue:
+                # Stays in the saved queue until this attempt is answered, requeued or dead-lettered
+                index, question_id, question, attempts = retry_queue.popleft()
+            else:
+                item = held if held is not None else next(pending, None)
+                held = None
+                if item is None:
+                    break
+                index, question_id, question = item
+                attempts = 0
+            i = index + 1
+            batch = [(index, question_id, question)]
+            
+            instr.begin_question(i, question_id)
+            fresh = attempts == 0  # retried questions are behind the saved progress already
+            answered = False
             try:
-                # Check if model switch needed
-                if model_manager.should_switch_model():
-                    print("🔄 Model usage limit approaching, switching...")
-                    if not model_manager.switch_model():
-                        print("⚠️ Could not switch model, continuing with current")
-                    time.sleep(random.uniform(3, 5))
-                
-                print(f"\n❓ Sending Q{i}: {question}")
-                
-                # Clear and type question (human-like)
-                input_box.clear()
-                time.sleep(random.uniform(0.5, 1))
-                
-                # Human-like typing
-                human_like_typing(input_box, question)
-                time.sleep(random.uniform(0.5, 1.5))
-                
-                # Send question
-                send_button = None
-                button_selectors = [
-                    (By.XPATH, SEND_BUTTON_XPATH),
-                    (By.CSS_SELECTOR, "button[aria-label='submit']"),
-                    (By.CSS_SELECTOR, "button[type='submit']"),
-                    (By.XPATH, "//button[contains(@class, 'send')]"),
-                    (By.CSS_SELECTOR, "button svg[class*='send']")
-                ]
+                # Already answered by this model?
+                if reuse_cached(i, question_id, question):
+                    with instr.span("persist"):
+                        if attempts:
+                            save_retry_queue()
+                        else:
+                            save_progress(i)
+                    instr.end_question(completed=True, cached=True)
+                    continue
                 
-                for by, selector in button_selectors:
-                    try:
-                        send_button = driver.find_element(by, selector)
-                        if send_button.is_enabled():
-                            break
-                    except:
-                        continue
+                # Pack following short questions into the same prompt
+                if BATCH_SIZE > 1 and not attempts and batchable(question):
+                    batch, held = gather_batch(batch[0], pending, model_manager.current_model)
+                    batch = batch[:1] + [item for item in batch[1:] if not reuse_cached(item[0] + 1, *item[1:])]
                 
-                if send_button and send_button.is_enabled():
-                    send_button.click()
+                if len(batch) > 1:
+                    missing = ask_batch(session, model_manager, instr, postprocessor, batch)
+                    response_received = len(missing) < len(batch)
+                    # Questions without an answer in the reply go on their own next
+                    for index_m, question_id_m, question_m in reversed(missing):
+                        if len(retry_queue) >= RETRY_QUEUE_LIMIT:
+                            print(f"🪦 Giving up on Q{index_m + 1}, retry queue full, see {DEAD_LETTER_FILE}")
+                            write_dead_letter(index_m + 1, question_id_m, question_m, 1,
+                                              "no answer in the packed reply")
+                        else:
+                            retry_queue.appendleft((index_m, question_id_m, question_m, 1))
+                    if missing:
+                        save_retry_queue()
                 else:
-                    input_box.send_keys(Keys.RETURN)
-                
-                print("✅ Question sent.")
+                    response_received = ask_question(session, model_manager, instr, postprocessor,
+                                                      i, question_id, question)
+                answered = True
                 
-                # Wait for response
-                response_received = wait_for_response_improved(driver)
-                
-                # Update model usage time
-                elapsed = time.time() - session_start
-                model_manager.update_usage_time(elapsed)
-                session_start = time.time()
-                
-                # Save progress
-                save_progress(i)
+                # Save progress (retried questions are behind it already)
+                with instr.span("persist"):
+                    if attempts:
+                        save_retry_queue()
+                    else:
+                        save_progress(batch[-1][0] + 1)
                 questions_this_session += 1
+                session.conversation_questions += 1
                 
-                # Random pause (human-like behavior)
-                if random.random() < 0.7:  # 70% short pause
-                    pause = random.uniform(5, 7)
-                else:  # 30% medium pause
-                    pause = random.uniform(8, 10)
+                # Start over in a new conversation before this one gets slow
+                with instr.span("rotate"):
+                    page = session.page_stats()
+                    reason = session.conversation_full(page)
+                    if reason:
+                        instr.event("rotate", f"🧹 Starting a new conversation ({reason})...", reason=reason)
+                        if not session.new_conversation():
+                            raise WebDriverException("input box missing in new conversation")
+                        if model_manager.current_model:
+                            model_manager.switch_model(model_manager.current_model)
                 
-                print(f"⏸ Pausing for {pause:.1f} seconds...")
-                time.sleep(pause)
-                
-                # Longer break patterns
-                if questions_this_session % 10 == 0:  # Every 10 questions
-                    long_pause = random.uniform(60, 90)  # 2-5 minutes
-                    print(f"☕ Taking a short break for {long_pause/60:.1f} minutes...")
-                    time.sleep(long_pause)
+                with instr.span("pause"):
+                    # Random pause (human-like behavior)
+                    if HUMAN_PAUSES:
+                        if random.random() < 0.7:  # 70% short pause
+                            pause = random.uniform(5, 7)
+                        else:  # 30% medium pause
+                            pause = random.uniform(8, 10)
+                        
+                        instr.event("pause", f"⏸ Pausing for {pause:.1f} seconds...", seconds=round(pause, 1))
+                        time.sleep(pause)
                     
-                    # Sometimes refresh page
-                    if random.random() < 0.2:
-                        print("🔄 Refreshing page...")
-                        driver.refresh()
-                        time.sleep(random.uniform(5, 10))
-                
-                if questions_this_session % 30 == 0:  # Every 30 questions
-                    long_pause = random.uniform(1000, 1800)  # 30-60 minutes
-                    print(f"😴 Taking a long break for {long_pause/60:.1f} minutes...")
-                    time.sleep(long_pause)
+                    # Longer break patterns
+                    if HUMAN_PAUSES and questions_this_session % 10 == 0:  # Every 10 questions
+                        long_pause = random.uniform(60, 90)  # 2-5 minutes
+                        instr.event("break", f"☕ Taking a short break for {long_pause/60:.1f} minutes...",
+                                    seconds=round(long_pause, 1))
+                        time.sleep(long_pause)
+                        
+                        # Sometimes refresh page
+                        if random.random() < 0.2:
+                            instr.event("refresh", "🔄 Refreshing page...")
+                            session.driver.refresh()
+                            time.sleep(random.uniform(5, 10))
+                    
+                    if HUMAN_PAUSES and questions_this_session % 30 == 0:  # Every 30 questions
+                        long_pause = random.uniform(1000, 1800)  # 30-60 minutes
+                        instr.event("long_break", f"😴 Taking a long break for {long_pause/60:.1f} minutes...",
+                                    seconds=round(long_pause, 1))
+                        time.sleep(long_pause)
                 
                 # Re-find input box (DOM might have changed)
-                for by, selector in selectors_to_try:
-                    try:
-                        input_box = driver.find_element(by, selector)
-                        if input_box:
-                            break
-                    except:
-                        continue
+                with instr.span("locate_input"):
+                    session.locate_input_box(wait=False)
                 
                 # Random mouse movements (human-like)
-                if random.random() < 0.3:
-                    actions = ActionChains(driver)
-                    x = random.randint(100, width - 100)
-                    y = random.randint(100, height - 100)
-                    actions.move_by_offset(x, y).perform()
-                    time.sleep(0.5)
-                    actions.move_by_offset(-x, -y).perform()
+                if HUMAN_PAUSES and random.random() < 0.3:
+                    with instr.span("pause"):
+                        actions = ActionChains(session.driver)
+                        x = random.randint(100, session.width - 100)
+                        y = random.randint(100, session.height - 100)
+                        actions.move_by_offset(x, y).perform()
+                        time.sleep(0.5)
+                        actions.move_by_offset(-x, -y).perform()
+                
+                instr.end_question(completed=response_received, questions=len(batch),
+                                   dom_nodes=page.get("nodes"), heap_mb=page.get("heap_mb"))
                 
             except Exception as e:
-                print(f"⚠️ Error with Q{i}: {e}. Continuing...")
-                save_progress(i)
-                time.sleep(random.uniform(5, 10))
+                instr.event("error", f"⚠️ Error with Q{i}: {e}. Continuing...", error=str(e))
+                instr.end_question(completed=False)
+                
+                # Only retry questions whose answer wasn't saved
+                if not answered:
+                    attempts += 1
+                    for index_f, question_id_f, question_f in reversed(batch):
+                        if attempts >= MAX_QUESTION_ATTEMPTS or len(retry_queue) >= RETRY_QUEUE_LIMIT:
+                            print(f"🪦 Giving up on Q{index_f + 1} after {attempts} attempt(s), see {DEAD_LETTER_FILE}")
+                            write_dead_letter(index_f + 1, question_id_f, question_f, attempts, str(e))
+                        else:
+                            retry_queue.appendleft((index_f, question_id_f, question_f, attempts))
+                    save_retry_queue()
+                elif not fresh:
+                    save_retry_queue()
+                if fresh:
+                    save_progress(batch[-1][0] + 1)
+                
+                if session.is_healthy():
+                    time.sleep(random.uniform(5, 10))
+                    # The page may have been re-rendered under a stale input box
+                    session.locate_input_box()
+                    continue
+                
+                print("💥 Browser is not responding.")
+                if not session.restart():
+                    print("❌ Could not restart the browser. Exiting.")
+                    return
+                model_manager.use_driver(session.driver, session.wait)
+                if model_manager.current_model:
+                    model_manager.switch_model(model_manager.current_model)
                 continue
         
         print("\n🎉 All questions processed successfully!")
@@ -553,16 +3067,23 @@ def run_automation():
     except Exception as e:
         print(f"❌ Fatal error: {e}")
     finally:
-        if driver:
-            try:
-                print("\n🔒 Closing browser in 5 seconds...")
-                time.sleep(5)
-                driver.quit()
-            except:
-                pass
+        if session.driver and not session.keep_browser and HUMAN_PAUSES:
+            print("\n🔒 Closing browser in 5 seconds...")
+            time.sleep(5)
+        session.close()
         
-        print(f"ℹ️ Persistent profile retained at: {PERSISTENT_PROFILE_DIR}")
-        print(f"ℹ️ Progress saved. You can resume from Q{START_INDEX + 1}")
+        postprocessor.close()
+        answer_store.close()
+        answer_cache.close()
+        instr.close()
+        resume_from = get_state_store().get("last_index", START_INDEX) + 1
+        close_state_store()
+        print(f"ℹ️ Answers saved to: {RESULTS_FILE}")
+        print(f"ℹ️ Persistent profile retained at: {profile_dir()}")
+        print(f"ℹ️ Progress saved. You can resume from Q{resume_from}")
 
 if __name__ == "__main__":
-    run_automation()
+    if sys.argv[1:2] == ["profile"]:
+        profile_command(sys.argv[2:])
+    else:
+        run_automation()
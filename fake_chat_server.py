@@ -0,0 +1,260 @@
+"""
+Local stand-in for the chat site, for benchmarking without touching it.
+
+Serves a page with the same textarea, submit button and model selector that
+chat_automation.py looks for, and streams fake assistant answers at a
+configurable token rate from a server-sent-events endpoint (/api/chat), like
+the real chat API. The page reports when each question was sent and when its
+answer truly finished, so detection lag can be measured.
+
+    python fake_chat_server.py --port 8765 --token-rate 30 --tokens 150
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from chat_automation import MODELS
+
+
+WORDS = ("lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod "
+         "tempor incididunt ut labore et dolore magna aliqua").split()
+
+
+PAGE_TEMPLATE = """<!doctype html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>Fake June Chat</title>
+<style>
+body { font-family: sans-serif; margin: 0; }
+main { max-width: 800px; margin: 0 auto; padding: 16px; }
+#model-menu span { display: block; cursor: pointer; padding: 4px; }
+.message { margin: 8px 0; padding: 8px; border-radius: 6px; }
+.message.user { background: #eef; }
+.message.assistant { background: #f4f4f4; }
+.typing { color: #888; }
+textarea { width: 100%; height: 80px; }
+</style>
+</head>
+<body>
+<main>
+  <header>
+    <button type="button" data-tour="model-selector" id="model-button">__DEFAULT_MODEL__</button>
+    <div id="model-menu" style="display: none">__MODEL_OPTIONS__</div>
+  </header>
+  <div id="messages"></div>
+  <form id="composer">
+    <textarea placeholder="Type your question here..."></textarea>
+    <button type="submit" aria-label="submit">Send</button>
+  </form>
+</main>
+<script>
+const messages = document.getElementById("messages");
+const textarea = document.querySelector("textarea");
+const modelButton = document.getElementById("model-button");
+const modelMenu = document.getElementById("model-menu");
+let questionCount = 0;
+
+function report(event) {
+    fetch("/event", {method: "POST", body: JSON.stringify(event), keepalive: true});
+}
+
+modelButton.addEventListener("click", () => {
+    modelMenu.style.display = modelMenu.style.display === "none" ? "block" : "none";
+});
+modelMenu.addEventListener("click", (e) => {
+    if (e.target.tagName === "SPAN") {
+        modelButton.textContent = e.target.textContent;
+        modelMenu.style.display = "none";
+    }
+});
+
+async function answer(index, question) {
+    const node = document.createElement("div");
+    node.className = "message assistant";
+    node.setAttribute("data-message-author", "assistant");
+    const prose = document.createElement("div");
+    prose.className = "prose";
+    const paragraph = document.createElement("p");
+    prose.appendChild(paragraph);
+    const typing = document.createElement("span");
+    typing.className = "typing";
+    typing.textContent = "...";
+    node.appendChild(prose);
+    node.appendChild(typing);
+    messages.appendChild(node);
+
+    const response = await fetch("/api/chat", {method: "POST", body: JSON.stringify({index: index, question: question})});
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = "", emitted = 0, cut;
+    while (true) {
+        const {value, done} = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, {stream: true});
+        while ((cut = buffer.indexOf("\\n\\n")) >= 0) {
+            const line = buffer.slice(0, cut);
+            buffer = buffer.slice(cut + 2);
+            if (!line.startsWith("data: ") || line === "data: [DONE]") continue;
+            paragraph.textContent += JSON.parse(line.slice(6)).content;
+            emitted++;
+            if (emitted === 1) report({type: "first_token", index: index, at: Date.now()});
+        }
+    }
+    typing.remove();
+    report({type: "complete", index: index, tokens: emitted, at: Date.now()});
+}
+
+function send() {
+    const text = textarea.value.trim();
+    if (!text) return;
+    const index = ++questionCount;
+    report({type: "sent", index: index, chars: text.length, model: modelButton.textContent, at: Date.now()});
+    const node = document.createElement("div");
+    node.className = "message user";
+    node.textContent = text;
+    messages.appendChild(node);
+    textarea.value = "";
+    answer(index, text);
+}
+
+document.getElementById("composer").addEventListener("submit", (e) => {
+    e.preventDefault();
+    send();
+});
+textarea.addEventListener("keydown", (e) => {
+    if (e.key === "Enter" && !e.shiftKey) {
+        e.preventDefault();
+        send();
+    }
+});
+</script>
+</body>
+</html>
+"""
+
+
+class FakeChatServer:
+    """Threaded HTTP server for the fake chat page, recording page events."""
+    def __init__(self, host="127.0.0.1", port=0, token_rate=30, tokens=150,
+                 first_token_delay=0.8, jitter=0.3):
+        self.config = {
+            "token_rate": token_rate,
+            "tokens": tokens,
+            "first_token_delay": first_token_delay,
+            "jitter": jitter
+        }
+        self.events = []
+        self.lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer((host, port), self._make_handler())
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/app/chat"
+
+    def render_page(self):
+        options = "".join(f"<span>{model}</span>" for model in MODELS)
+        return (PAGE_TEMPLATE
+                .replace("__DEFAULT_MODEL__", MODELS[0])
+                .replace("__MODEL_OPTIONS__", options))
+
+    def stream_answer(self, wfile):
+        """Write one answer as server-sent events, token by token."""
+        jitter = 1 + random.uniform(-1, 1) * self.config["jitter"]
+        total = max(1, round(self.config["tokens"] * jitter))
+        time.sleep(self.config["first_token_delay"])
+        for n in range(total):
+            if n:
+                time.sleep(1 / self.config["token_rate"])
+            wfile.write(f"data: {json.dumps({'content': WORDS[n % len(WORDS)] + ' '})}\n\n".encode("utf-8"))
+            wfile.flush()
+        wfile.write(b"data: [DONE]\n\n")
+
+    def events_of(self, event_type):
+        """Recorded events of one type, in the order they arrived."""
+        with self.lock:
+            return [e for e in self.events if e.get("type") == event_type]
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] == "/events":
+                    with server.lock:
+                        body = json.dumps(server.events).encode("utf-8")
+                    content_type = "application/json"
+                else:
+                    body = server.render_page().encode("utf-8")
+                    content_type = "text/html; charset=utf-8"
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                try:
+                    event = json.loads(self.rfile.read(length) or b"{}")
+                except ValueError:
+                    event = None
+                if self.path.split("?")[0] == "/api/chat":
+                    # No Content-Length: the stream ends when the connection closes
+                    self.send_response(200)
+                    self.send_header("Content-Type", "text/event-stream")
+                    self.send_header("Cache-Control", "no-cache")
+                    self.end_headers()
+                    server.stream_answer(self.wfile)
+                    return
+                if isinstance(event, dict):
+                    event["received"] = time.time()
+                    with server.lock:
+                        server.events.append(event)
+                self.send_response(204)
+                self.end_headers()
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        """Serve in a background thread."""
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve a fake chat page for local benchmarking.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--token-rate", type=float, default=30, help="tokens streamed per second")
+    parser.add_argument("--tokens", type=int, default=150, help="average answer length in tokens")
+    parser.add_argument("--first-token-delay", type=float, default=0.8, help="seconds before the first token")
+    parser.add_argument("--jitter", type=float, default=0.3, help="relative spread of answer lengths")
+    args = parser.parse_args()
+
+    server = FakeChatServer(args.host, args.port, args.token_rate, args.tokens,
+                            args.first_token_delay, args.jitter)
+    print(f"🌍 Fake chat page at {server.url}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+
+
+if __name__ == "__main__":
+    main()
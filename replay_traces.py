@@ -0,0 +1,127 @@
+"""
+Replays recorded polling snapshots through CompletionDetector offline.
+
+Runs with TRACE_RECORD_DIR set save every polled wait (the page snapshots,
+plus a few seconds after the decision) as JSON lines. This script re-runs
+the detection logic over those timelines for a grid of thresholds and
+reports, for each setting, how long after the answer really finished it was
+detected and how often it would have stopped before the answer was done.
+
+    python replay_traces.py snapshots/ --stable-checks 1,2,3,4 --quiet 0,0.5,1,1.5,2
+"""
+import argparse
+import glob
+import json
+import os
+import statistics
+
+from chat_automation import CompletionDetector
+from benchmark import percentile
+
+
+def load_traces(paths):
+    traces = []
+    for path in paths:
+        files = sorted(glob.glob(os.path.join(path, "*.jsonl"))) if os.path.isdir(path) else [path]
+        for name in files:
+            with open(name, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        traces.append(json.loads(line))
+                    except ValueError:
+                        continue  # torn last line of a run that was killed
+    return traces
+
+
+def ground_truth(trace, settled):
+    """
+    Seconds at which the answer really finished: when its final text first
+    appeared. None if the text was still changing near the end of the
+    recording (or there is no text), since then the finish isn't known.
+    """
+    snapshots = trace["snapshots"]
+    final = next((s["hash"] for s in reversed(snapshots) if s["hash"]), None)
+    if final is None:
+        return None
+    finished = None
+    for snapshot in reversed(snapshots):
+        if snapshot["hash"] != final:
+            break
+        finished = snapshot["t"]
+    if snapshots[-1]["t"] - finished < settled:
+        return None
+    return finished
+
+
+def replay(snapshots, stable_checks, quiet_period):
+    """Seconds at which the detector would have called the answer finished, or None."""
+    detector = CompletionDetector(stable_checks, quiet_period)
+    for snapshot in snapshots:
+        if detector.feed(snapshot, snapshot["t"]):
+            return snapshot["t"]
+    return None
+
+
+def score(traces, stable_checks, quiet_period):
+    lags = []
+    early = missed = 0
+    for trace, truth in traces:
+        detected = replay(trace["snapshots"], stable_checks, quiet_period)
+        if detected is None:
+            missed += 1
+        elif detected < truth:
+            early += 1
+        else:
+            lags.append(detected - truth)
+    return {
+        "stable_checks": stable_checks,
+        "quiet": quiet_period,
+        "traces": len(traces),
+        "early": early,
+        "missed": missed,
+        "lag_mean": round(statistics.mean(lags), 3) if lags else None,
+        "lag_p50": round(percentile(lags, 0.5), 3) if lags else None,
+        "lag_p95": round(percentile(lags, 0.95), 3) if lags else None
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Score detection thresholds against recorded snapshot traces.")
+    parser.add_argument("paths", nargs="+", help="TRACE_RECORD_DIR folders or snapshot .jsonl files")
+    parser.add_argument("--stable-checks", default="1,2,3,4,5", help="comma-separated values to try")
+    parser.add_argument("--quiet", default="0,0.5,1,1.5,2,3", help="comma-separated quiet periods (seconds)")
+    parser.add_argument("--settled", type=float, default=2.0,
+                        help="seconds the final text must last in a recording for it to be scored")
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    traces = []
+    unresolved = 0
+    for trace in load_traces(args.paths):
+        truth = ground_truth(trace, args.settled) if trace.get("snapshots") else None
+        if truth is None:
+            unresolved += 1
+        else:
+            traces.append((trace, truth))
+    print(f"📼 {len(traces)} traces to replay ({unresolved} without a known finish skipped)")
+    if not traces:
+        return
+
+    results = [score(traces, checks, quiet)
+               for checks in (int(v) for v in args.stable_checks.split(","))
+               for quiet in (float(v) for v in args.quiet.split(","))]
+    results.sort(key=lambda r: (r["early"] + r["missed"], r["lag_mean"] if r["lag_mean"] is not None else 1e9))
+
+    print(f"\n{'checks':>6} {'quiet':>6} {'early':>6} {'missed':>6} {'lag mean':>9} {'p50':>7} {'p95':>7}")
+    for r in results:
+        print(f"{r['stable_checks']:>6} {r['quiet']:>6} {r['early']:>6} {r['missed']:>6} "
+              f"{r['lag_mean'] if r['lag_mean'] is not None else '-':>9} "
+              f"{r['lag_p50'] if r['lag_p50'] is not None else '-':>7} "
+              f"{r['lag_p95'] if r['lag_p95'] is not None else '-':>7}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()